@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark the Datalab submission pipeline against the local mock API.
+Measures throughput of the one-at-a-time client, how the async batch client
+scales with its in-flight limit, and how both behave under rate limiting
+and job failures. No network access is needed.
+"""
+import io
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+import contextlib
+from pathlib import Path
+import process_with_datalab as datalab
+import datalab_batch
+from mock_datalab import MockDatalab
+
+def make_jobs(pdf_path, count, work_dir):
+    """Link the same PDF under `count` names so each job has its own outputs"""
+    jobs_dir = Path(work_dir) / "jobs"
+    jobs_dir.mkdir()
+    jobs = []
+    for i in range(count):
+        job_path = jobs_dir / f"job{i:03d}.pdf"
+        os.symlink(os.path.abspath(pdf_path), job_path)
+        jobs.append(job_path)
+    return jobs
+
+def run_sequential(jobs, output_dir):
+    ok = 0
+    for job in jobs:
+        datalab.process_pdf_with_datalab(job, output_dir, api_key="bench", use_text_layer=False, cache_dir=None)
+        ok += (Path(output_dir) / f"{job.stem}.md").exists()
+    return ok
+
+def run_batch(jobs, output_dir, max_in_flight):
+    results = asyncio.run(datalab_batch.convert_pdfs(jobs, output_dir, api_key="bench", max_in_flight=max_in_flight,
+                                                     use_text_layer=False, cache_dir=None))
+    return sum(results.values())
+
+def measure(api, label, run):
+    """Run one scenario with its output silenced; print wall time, throughput and request counts"""
+    api.reset_stats()
+    with tempfile.TemporaryDirectory() as output_dir, contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        ok = run(output_dir)
+        elapsed = time.perf_counter() - start
+    stats = api.stats
+    print(f"  {label:<28} {elapsed:7.2f}s  {ok / elapsed:6.2f} jobs/s  ok {ok:>3}  "
+          f"submits {stats['submits']:>3}  checks {stats['checks']:>4}  "
+          f"429s {stats['rate_limited']:>3}  failed {stats['failed']:>3}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Datalab client against the local mock API")
+    parser.add_argument("--pdf", default="pdfs/0889-012-135-004.pdf", help="PDF submitted by every job")
+    parser.add_argument("--jobs", type=int, default=16, help="Number of jobs per scenario (default: 16)")
+    parser.add_argument("--latency", type=float, default=1.0, help="Mock processing time per job (default: 1s)")
+    parser.add_argument("--in-flight", default="1,2,4,8,16", help="In-flight limits to compare (default: 1,2,4,8,16)")
+    args = parser.parse_args()
+
+    api = MockDatalab(port=0, latency=args.latency).start()
+    datalab.API_URL = api.api_url
+    print(f"Mock API at {api.api_url}, {args.jobs} jobs of {args.pdf}, {args.latency}s per job\n")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        jobs = make_jobs(args.pdf, args.jobs, work_dir)
+
+        print("--- Throughput ---")
+        measure(api, "sequential", lambda out: run_sequential(jobs, out))
+        print("\n--- Concurrency scaling (async batch) ---")
+        for limit in map(int, args.in_flight.split(',')):
+            measure(api, f"max_in_flight={limit}", lambda out: run_batch(jobs, out, limit))
+
+        print("\n--- Retries (async batch, max_in_flight=8) ---")
+        api.rate_limit, api.retry_after = 0.2, 1
+        measure(api, "20% of requests get 429", lambda out: run_batch(jobs, out, 8))
+        api.rate_limit, api.failure_rate = 0.0, 0.25
+        measure(api, "25% of jobs fail", lambda out: run_batch(jobs, out, 8))
+
+    api.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Benchmark import time and model cold start for the local OCR scripts.
+Every measurement runs in a fresh interpreter so nothing is cached.
+"""
+import sys
+import subprocess
+import time
+
+MODULES = ['process_pdf', 'ocr_prototype', 'test_formula', 'ocr_engine']
+
+def time_snippet(code, repeat=3):
+    """Return the best wall time (seconds) of running `code` in a new interpreter"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True, capture_output=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    baseline = time_snippet('pass')
+    print(f"Interpreter start-up: {baseline:.2f}s (subtracted below)\n")
+
+    print("--- Import time ---")
+    for module in MODULES:
+        elapsed = time_snippet(f'import {module}') - baseline
+        print(f"  import {module:<15} {elapsed:6.2f}s")
+
+    print("\n--- Model cold start ---")
+    eager = time_snippet(
+        "from paddleocr import PaddleOCR; PaddleOCR(use_angle_cls=True, lang='ar')", repeat=1
+    ) - baseline
+    print(f"  eager PaddleOCR at import  {eager:6.2f}s")
+
+    lazy = time_snippet("import models; models.get_model('ocr')", repeat=1) - baseline
+    print(f"  lazy get_model('ocr')      {lazy:6.2f}s (paid on first use only)")
+
+if __name__ == "__main__":
+    main()
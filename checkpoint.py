@@ -0,0 +1,130 @@
+"""
+Checkpoints for resumable conversions.
+A run directory holds a manifest describing the input and settings, plus one
+checkpoint per finished page (local OCR) or per API chunk (Datalab). A run
+started with resume=True reuses the checkpoints when the manifest still
+matches, so only the missing pieces are processed again.
+"""
+import os
+import json
+import shutil
+import hashlib
+from pathlib import Path
+import numpy as np
+from ocr_cache import encode_lines, decode_lines, CORRUPT_ENTRY_ERRORS
+
+MANIFEST_NAME = "manifest.json"
+
+def file_sha256(path, block_size=1024 * 1024):
+    """Return the SHA-256 hex digest of a file, read in blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _write_atomic(path, write):
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'wb') as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+class RunCheckpoint:
+    """Manifest plus per-page / per-chunk checkpoints in one run directory"""
+
+    def __init__(self, run_dir):
+        self.run_dir = Path(run_dir)
+        self.manifest_path = self.run_dir / MANIFEST_NAME
+
+    def open(self, settings, resume=False):
+        """
+        Start or resume a run. `settings` (JSON-serializable) describes the
+        input and options; checkpoints are only reused when they match.
+        Returns True if an earlier run is being resumed.
+        """
+        if resume and self.manifest_path.exists():
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('settings') == settings:
+                return True
+            print("Checkpoints were made with other settings or another PDF; starting over")
+
+        # Fresh run: drop stale checkpoints
+        if self.run_dir.exists():
+            shutil.rmtree(self.run_dir)
+        self.run_dir.mkdir(parents=True)
+        self._write_manifest({'settings': settings, 'status': 'running'})
+        return False
+
+    def finish(self):
+        """
+        Mark the run complete. Page checkpoints are kept so outputs can be
+        rebuilt; API results are dropped from chunk checkpoints (the outputs
+        hold them now), leaving only what is needed to poll the job again.
+        """
+        for path in self.run_dir.glob("chunk_*.json"):
+            with open(path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if 'result' not in state:
+                continue
+            if state.get('check_url'):
+                self.save_chunk(path.stem[len("chunk_"):], {
+                    'status': 'submitted',
+                    'request_id': state.get('request_id'),
+                    'check_url': state['check_url'],
+                })
+            else:
+                path.unlink()
+
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        manifest['status'] = 'complete'
+        self._write_manifest(manifest)
+
+    def _write_manifest(self, manifest):
+        data = json.dumps(manifest, indent=2, ensure_ascii=False).encode('utf-8')
+        _write_atomic(self.manifest_path, lambda f: f.write(data))
+
+    # --- Local OCR: one checkpoint per page ---
+
+    def _page_path(self, page_index):
+        return self.run_dir / f"page_{page_index + 1:04d}.npz"
+
+    def save_page(self, page_index, lines):
+        """Record a page's OCR lines (None for a page with no text)"""
+        _write_atomic(self._page_path(page_index), lambda f: np.savez(f, **encode_lines(lines)))
+
+    def load_pages(self):
+        """Return {page_index: lines} for every page checkpointed so far"""
+        pages = {}
+        for path in sorted(self.run_dir.glob("page_*.npz")):
+            page_index = int(path.stem.split('_')[1]) - 1
+            try:
+                with np.load(path) as entry:
+                    pages[page_index] = decode_lines(entry)
+            except CORRUPT_ENTRY_ERRORS:
+                # Written when the run was killed: OCR the page again
+                print(f"Discarding damaged checkpoint: {path.name}")
+                path.unlink()
+        return pages
+
+    # --- API: one checkpoint per chunk ---
+
+    def _chunk_path(self, chunk_id):
+        return self.run_dir / f"chunk_{chunk_id}.json"
+
+    def save_chunk(self, chunk_id, state):
+        """
+        Record an API chunk's state, e.g. {'status': 'submitted', 'check_url': ...}
+        or {'status': 'complete', 'result': ...}
+        """
+        data = json.dumps(state, ensure_ascii=False).encode('utf-8')
+        _write_atomic(self._chunk_path(chunk_id), lambda f: f.write(data))
+
+    def load_chunk(self, chunk_id):
+        """Return a chunk's last recorded state, or None"""
+        path = self._chunk_path(chunk_id)
+        if not path.exists():
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
@@ -0,0 +1,205 @@
+"""
+Convert many PDFs with the Datalab marker API concurrently.
+All submissions and status polls run on one asyncio event loop: up to
+max_in_flight jobs are outstanding at once, and each job's outputs are
+written as soon as it completes, while the others keep polling.
+"""
+import os
+import sys
+import asyncio
+import argparse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import aiohttp
+from dotenv import load_dotenv
+import process_with_datalab as datalab
+from checkpoint import file_sha256
+from response_cache import ConversionCache, DEFAULT_CACHE_DIR
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Rejected submissions (429, 5xx) are retried this many times in all, waiting
+# SUBMIT_RETRY_DELAY seconds, doubled each time, or the server's Retry-After
+SUBMIT_ATTEMPTS = 4
+SUBMIT_RETRY_DELAY = 2
+
+# PyMuPDF is not thread-safe: every call into it runs on this one thread
+PYMUPDF_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pymupdf")
+
+async def submit_conversion(session, pdf_path, use_llm=False, page_range=None):
+    """Submit one PDF, retrying rate-limited or busy responses; returns the submit response, or None on error"""
+    pdf_bytes = await asyncio.to_thread(Path(pdf_path).read_bytes)
+    for attempt in range(SUBMIT_ATTEMPTS):
+        # A form can only be sent once
+        form = aiohttp.FormData()
+        form.add_field('file', pdf_bytes, filename=Path(pdf_path).name, content_type='application/pdf')
+        for name, value in datalab.conversion_options(use_llm, page_range).items():
+            form.add_field(name, str(value))
+
+        try:
+            async with session.post(datalab.API_URL, data=form) as response:
+                status = response.status
+                if status in datalab.RETRY_STATUS and attempt + 1 < SUBMIT_ATTEMPTS:
+                    delay = max(SUBMIT_RETRY_DELAY * 2 ** attempt,
+                                datalab.retry_after_seconds(response.headers) or 0)
+                elif status >= 400:
+                    print(f"ERROR submitting {pdf_path}: HTTP {status}: {await response.text()}")
+                    return None
+                else:
+                    data = await response.json(content_type=None)
+                    break
+        except aiohttp.ClientError as e:
+            print(f"ERROR submitting {pdf_path}: {e}")
+            return None
+        print(f"HTTP {status} submitting {pdf_path}, retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+    if not data.get('success'):
+        print(f"ERROR submitting {pdf_path}: {data.get('error', 'Unknown error')}")
+        return None
+    return data
+
+async def poll_conversion(session, check_url, name, timeout=datalab.POLL_TIMEOUT):
+    """Poll one job until it completes or fails; returns the final result, or None on timeout"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    delay = datalab.poll_delay(0)
+    attempt = 0
+
+    while loop.time() + delay < deadline:
+        await asyncio.sleep(delay)
+        attempt += 1
+        delay = datalab.poll_delay(attempt)
+        try:
+            async with session.get(check_url) as response:
+                # Rate limited or busy: wait as long as the server asks
+                retry_after = datalab.retry_after_seconds(response.headers)
+                if retry_after is not None:
+                    delay = max(delay, retry_after)
+                response.raise_for_status()
+                check_result = await response.json(content_type=None)
+        except aiohttp.ClientError as e:
+            print(f"[{name}] ERROR checking status: {e}")
+            continue
+
+        status = check_result.get('status')
+        if status in ('complete', 'failed'):
+            return check_result
+        print(f"[{name}] Status: {status} (poll {attempt}, next in {delay:.1f}s)")
+    return None
+
+async def convert_pdf(session, limit, pdf_path, output_dir, use_llm=False, use_text_layer=True, cache=None):
+    """Convert one PDF into output_dir. Returns True on success."""
+    pdf_path = Path(pdf_path)
+    name = pdf_path.name
+    base_name = pdf_path.stem
+
+    text_pages_md, ocr_pages = {}, None
+    if use_text_layer:
+        text_pages_md, ocr_pages = await asyncio.get_running_loop().run_in_executor(
+            PYMUPDF_EXECUTOR, datalab.split_text_layer_pages, pdf_path)
+        if not ocr_pages:
+            markdown = datalab.join_paginated_markdown(sorted(text_pages_md.items()))
+            await asyncio.to_thread((output_dir / f"{base_name}.md").write_text, markdown, encoding='utf-8')
+            print(f"[{name}] Saved Markdown (no API call needed)")
+            return True
+    page_range = datalab.format_page_range(ocr_pages) if text_pages_md else None
+
+    if cache:
+        pdf_sha256 = await asyncio.to_thread(file_sha256, pdf_path)
+        cache_key = cache.key(pdf_sha256, datalab.API_URL, datalab.conversion_options(use_llm, page_range))
+        check_result = await asyncio.to_thread(cache.get, cache_key)
+        if check_result is not None:
+            print(f"[{name}] Using cached conversion")
+            await asyncio.to_thread(datalab.save_conversion, check_result, output_dir, base_name,
+                                    ocr_pages, text_pages_md)
+            return True
+
+    # The slot is held from submission until the job finishes
+    async with limit:
+        data = await submit_conversion(session, pdf_path, use_llm, page_range)
+        if data is None:
+            return False
+        print(f"[{name}] Submitted, request ID: {data['request_id']}")
+        check_result = await poll_conversion(session, data['request_check_url'], name)
+
+    if check_result is None:
+        print(f"[{name}] ⏱️ Timeout waiting for conversion")
+        return False
+    if check_result.get('status') == 'failed':
+        print(f"[{name}] ❌ Conversion failed: {check_result.get('error', 'Unknown error')}")
+        return False
+
+    print(f"[{name}] ✅ Conversion complete!")
+    # File writes run off the loop so other jobs keep polling
+    if cache:
+        await asyncio.to_thread(cache.put, cache_key, check_result)
+    await asyncio.to_thread(datalab.save_conversion, check_result, output_dir, base_name,
+                            ocr_pages, text_pages_md)
+    return True
+
+async def convert_pdfs(pdf_paths, output_dir, api_key=None, max_in_flight=4, use_llm=False, use_text_layer=True,
+                       cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Convert several PDFs concurrently with at most max_in_flight API jobs
+    outstanding. Finished conversions are cached in cache_dir (None
+    disables the cache). Returns {pdf_path: succeeded}.
+    """
+    if api_key is None:
+        api_key = os.getenv("DATALAB_API_KEY")
+    if not api_key:
+        print("ERROR: No API key provided!")
+        print("Please set DATALAB_API_KEY environment variable or pass api_key parameter")
+        return {}
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    limit = asyncio.Semaphore(max_in_flight)
+    cache = ConversionCache(cache_dir) if cache_dir else None
+
+    async with aiohttp.ClientSession(headers={"X-Api-Key": api_key}) as session:
+        outcomes = await asyncio.gather(
+            *(convert_pdf(session, limit, pdf_path, output_dir, use_llm, use_text_layer, cache) for pdf_path in pdf_paths),
+            return_exceptions=True)
+
+    results = {}
+    for pdf_path, outcome in zip(pdf_paths, outcomes):
+        if isinstance(outcome, Exception):
+            print(f"[{Path(pdf_path).name}] ERROR: {outcome}")
+        results[pdf_path] = outcome is True
+    return results
+
+def collect_pdfs(paths):
+    """Expand directories into the PDFs they contain"""
+    pdf_paths = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            pdf_paths.extend(sorted(path.glob("*.pdf")))
+        else:
+            pdf_paths.append(path)
+    return pdf_paths
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert many PDFs with the Datalab API concurrently")
+    parser.add_argument("inputs", nargs="+", help="PDF files and/or directories of PDFs")
+    parser.add_argument("output_dir")
+    parser.add_argument("--max-in-flight", type=int, default=4,
+                        help="Maximum number of API jobs outstanding at once (default: 4)")
+    parser.add_argument("--use-llm", action="store_true", help="Use LLM for better accuracy (slower, costs more)")
+    parser.add_argument("--ocr-all", action="store_true",
+                        help="Send every page to OCR, even pages with a usable text layer")
+    parser.add_argument("--no-cache", action="store_true", help="Always call the API, ignoring cached conversions")
+    args = parser.parse_args()
+
+    pdf_paths = collect_pdfs(args.inputs)
+    if not pdf_paths:
+        parser.error("no PDFs found")
+    results = asyncio.run(convert_pdfs(pdf_paths, args.output_dir, max_in_flight=args.max_in_flight,
+                                       use_llm=args.use_llm, use_text_layer=not args.ocr_all,
+                                       cache_dir=None if args.no_cache else DEFAULT_CACHE_DIR))
+    failed = [str(path) for path, ok in results.items() if not ok]
+    print(f"\n{len(results) - len(failed)}/{len(pdf_paths)} PDFs converted")
+    for path in failed:
+        print(f"  FAILED: {path}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,74 @@
+"""
+Size-capped on-disk cache directory shared by the OCR page cache and the
+Datalab conversion cache. Each entry is one file, named by its key and
+spread over subdirectories by the key's first two characters. Entries are
+written atomically, and once the directory grows past its size cap the
+least recently used entries are evicted first.
+"""
+import os
+from pathlib import Path
+
+class DiskCache:
+    """Directory of cache entries with a size cap and LRU eviction; subclasses set `suffix`"""
+
+    suffix = None
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._total_bytes = sum(path.stat().st_size for path in self._entries())
+
+    def _path(self, key):
+        return self.cache_dir / key[:2] / f"{key}{self.suffix}"
+
+    def _entries(self):
+        return self.cache_dir.glob(f"*/*{self.suffix}")
+
+    def _store(self, key, write, encoding=None):
+        """
+        Write an entry atomically with write(file), then evict if over the cap.
+        The file is opened in binary mode, or as text if an encoding is given.
+        """
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+
+        with open(tmp_path, 'w' if encoding else 'wb', encoding=encoding) as f:
+            write(f)
+        previous = path.stat().st_size if path.exists() else 0
+        os.replace(tmp_path, path)
+
+        self._total_bytes += path.stat().st_size - previous
+        if self._total_bytes > self.max_bytes:
+            self._evict()
+
+    def _discard(self, path):
+        try:
+            size = path.stat().st_size
+            path.unlink()
+        except OSError:
+            return
+        self._total_bytes -= size
+
+    def _evict(self):
+        """Drop least recently used entries until the cache is back under 90% of its cap"""
+        entries = []
+        for path in self._entries():
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        self._total_bytes = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if self._total_bytes <= target:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            self._total_bytes -= size
@@ -0,0 +1,91 @@
+"""
+Persistent cache of LaTeX formulas rendered to MathML.
+Rendering is done once per distinct formula: results (including formulas
+latex2mathml cannot convert) are stored in a SQLite database keyed by the
+LaTeX, display mode and latex2mathml version, so re-exporting a document,
+or another thesis that reuses its notation, converts no formula twice.
+"""
+import sqlite3
+import hashlib
+from pathlib import Path
+from importlib import metadata
+from latex2mathml.converter import convert as latex_to_mathml
+
+DEFAULT_CACHE_PATH = Path.home() / ".cache" / "ocr-chandra" / "formulas.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS formulas (
+    key TEXT PRIMARY KEY,
+    mathml TEXT  -- NULL: latex2mathml could not convert the formula
+);
+"""
+
+def renderer_version():
+    try:
+        return f"latex2mathml={metadata.version('latex2mathml')}"
+    except metadata.PackageNotFoundError:
+        return "latex2mathml=unknown"
+
+class FormulaCache:
+    """
+    Render formulas to MathML through a cache. The database is optional:
+    with path=None only the in-memory layer is used. New renderings are
+    written when the cache is closed.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        self.version = renderer_version()
+        self.hits = 0
+        self.misses = 0
+        self._memory = {}
+        self._new = {}
+        self.conn = None
+        if path is not None:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self.conn = sqlite3.connect(path)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript(SCHEMA)
+
+    def key(self, latex, display):
+        description = f"{self.version}|{'block' if display else 'inline'}|{latex}"
+        return hashlib.sha256(description.encode('utf-8')).hexdigest()
+
+    def render(self, latex, display=False):
+        """Return the MathML for a formula, or None if it cannot be converted"""
+        key = self.key(latex, display)
+        if key in self._memory:
+            self.hits += 1
+            return self._memory[key]
+
+        row = None
+        if self.conn is not None:
+            row = self.conn.execute("SELECT mathml FROM formulas WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self.hits += 1
+            mathml = row[0]
+        else:
+            self.misses += 1
+            try:
+                mathml = latex_to_mathml(latex, display="block" if display else "inline")
+            except Exception:
+                mathml = None
+            self._new[key] = mathml
+        self._memory[key] = mathml
+        return mathml
+
+    def close(self):
+        """Store new renderings in one transaction and close the database"""
+        if self.conn is None:
+            return
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO formulas (key, mathml) VALUES (?, ?)",
+                                  self._new.items())
+        self._new.clear()
+        self.conn.close()
+        self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,114 @@
+"""
+Extract the embedded images of a PDF, once each.
+Images reused across pages (logos, watermarks, repeated figures) share one
+xref, and identical images are sometimes embedded under several xrefs, so
+images are deduplicated by xref and then by content hash. Each unique image
+is written once, from a thread pool, and manifest.json in the images
+directory records which images appear on which page.
+"""
+import os
+import re
+import json
+import hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import fitz  # PyMuPDF
+
+MANIFEST_NAME = "manifest.json"
+# Images narrower or shorter than this (in pixels) are decorative rules and slivers
+MIN_IMAGE_SIZE = 32
+
+def _write_file(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+def extract_images_from_pdf(pdf_path, output_dir, min_size=MIN_IMAGE_SIZE, workers=4):
+    """
+    Extract all unique images from a PDF using PyMuPDF.
+    Files are named after the first page and position they appear at
+    (page3_img1.png). Returns the manifest:
+        {'pages': {page_number: [filename, ...]},
+         'images': {filename: {'xref', 'width', 'height', 'pages'}}}
+    with 1-indexed page numbers.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    by_xref = {}   # xref -> filename, or None if filtered out
+    by_hash = {}   # content hash -> filename
+    pages = {}
+    images = {}
+    skipped = 0
+
+    # Decoding stays on this thread (PyMuPDF is not thread-safe); only file writes are pooled
+    with fitz.open(pdf_path) as doc, ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for page in doc:
+            page_number = page.number + 1
+            page_images = []
+
+            for img_index, img in enumerate(page.get_images(full=True)):
+                xref, width, height = img[0], img[2], img[3]
+                if xref not in by_xref:
+                    by_xref[xref] = None
+                    if min(width, height) < min_size:
+                        skipped += 1
+                        continue
+
+                    base_image = doc.extract_image(xref)
+                    image_bytes = base_image["image"]
+                    digest = hashlib.blake2b(image_bytes, digest_size=20).hexdigest()
+                    if digest in by_hash:
+                        by_xref[xref] = by_hash[digest]
+                    else:
+                        image_filename = f"page{page_number}_img{img_index+1}.{base_image['ext']}"
+                        by_hash[digest] = by_xref[xref] = image_filename
+                        images[image_filename] = {'xref': xref, 'width': width, 'height': height, 'pages': []}
+
+                        # Bound the bytes held by queued writes
+                        if len(pending) >= workers * 4:
+                            pending.popleft().result()
+                        pending.append(pool.submit(_write_file, os.path.join(output_dir, image_filename), image_bytes))
+                        print(f"  Extracted: {image_filename}")
+
+                image_filename = by_xref[xref]
+                if image_filename and image_filename not in page_images:
+                    page_images.append(image_filename)
+                    images[image_filename]['pages'].append(page_number)
+
+            if page_images:
+                pages[page_number] = page_images
+
+        for future in pending:
+            future.result()
+
+    manifest = {'pages': pages, 'images': images}
+    with open(os.path.join(output_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    references = sum(len(names) for names in pages.values())
+    print(f"Total images extracted: {len(images)} unique "
+          f"({references} page references, {skipped} too small to keep)")
+    return manifest
+
+def page_images(images_dir):
+    """
+    Return {page_number: [image Path, ...]} (1-indexed) for an images directory.
+    Uses the extractor's manifest, so an image shared by several pages is
+    listed under each of them; without a manifest, pages are read from the
+    pageN_ file names.
+    """
+    images_dir = Path(images_dir)
+    manifest_path = images_dir / MANIFEST_NAME
+    if manifest_path.exists():
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        return {int(page): [images_dir / name for name in names]
+                for page, names in manifest['pages'].items()}
+
+    page_to_image = {}
+    for img_file in sorted(images_dir.glob("*")):
+        # Extract page number from filename (e.g., page16_img1.jpeg -> 16)
+        match = re.search(r'page(\d+)_', img_file.name)
+        if match:
+            page_to_image.setdefault(int(match.group(1)), []).append(img_file)
+    return page_to_image
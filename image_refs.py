@@ -0,0 +1,81 @@
+"""
+Rewrite image references in paginated markdown in a single pass.
+The markdown is scanned once for {N}---- page markers and ![alt](path)
+image links together, so each link is resolved knowing the page it sits
+on, against an index of the image files built before the scan.
+"""
+import re
+from pathlib import Path
+from image_extractor import page_images
+
+# One token per match: a {page_index}---- marker or an ![alt](path) image link
+TOKEN_RE = re.compile(r'\{(\d+)\}-{3,}|!\[([^\]]*)\]\(([^)]*)\)')
+# Page number in API image names, e.g. _page_3_Figure_1.jpeg
+IMAGE_PAGE_RE = re.compile(r'_page_(\d+)_')
+
+def rewrite_image_refs(markdown, resolve):
+    """
+    Return markdown with each image link replaced by resolve(alt, path, page),
+    where page is the 0-indexed page of the last marker seen (None before the
+    first). Links for which resolve returns None are kept as they are.
+    """
+    pieces = []
+    last = 0
+    page = None
+    for match in TOKEN_RE.finditer(markdown):
+        if match.group(1) is not None:
+            page = int(match.group(1))
+            continue
+        replacement = resolve(match.group(2), match.group(3), page)
+        if replacement is not None:
+            pieces.append(markdown[last:match.start()])
+            pieces.append(replacement)
+            last = match.end()
+    if not pieces:
+        return markdown
+    pieces.append(markdown[last:])
+    return ''.join(pieces)
+
+def rename_image_refs(markdown, renames):
+    """Point links whose path is a key of `renames` ({old path: new path}) at the new path"""
+    if not renames:
+        return markdown
+
+    def resolve(alt, path, page):
+        if path in renames:
+            return f"![{alt}]({renames[path]})"
+        return None
+
+    return rewrite_image_refs(markdown, resolve)
+
+def link_page_images(markdown, images_dir):
+    """
+    Point API image links (_page_N_ names) and empty ![]() links at the
+    images extracted from the PDF into images_dir. The page comes from the
+    image name, or else from the page marker the link appears under; the
+    first image extracted from that page is used.
+
+    Returns (markdown, number of links rewritten).
+    """
+    images_dir = Path(images_dir)
+    page_to_image = page_images(images_dir)
+    if not page_to_image:
+        return markdown, 0
+
+    fixed = 0
+
+    def resolve(alt, path, page):
+        nonlocal fixed
+        page_match = IMAGE_PAGE_RE.search(path)
+        if page_match:
+            page = int(page_match.group(1))
+        elif path or page is None:
+            return None
+        # Markers and API names count from 0, extracted image names from 1
+        images = page_to_image.get(page + 1)
+        if not images:
+            return None
+        fixed += 1
+        return f"![{alt or f'Image from page {page + 1}'}]({images_dir.name}/{images[0].name})"
+
+    return rewrite_image_refs(markdown, resolve), fixed
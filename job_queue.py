@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Persistent queue for converting large batches of PDFs with the Datalab API.
+Jobs live in a SQLite database and move through pending -> submitted ->
+complete (or failed once their retries are used up). A single worker
+drains the queue: every API request first takes a token from a token bucket
+sized to the account's rate limit, rate-limit and server errors are retried
+with exponential backoff (or the server's Retry-After), and each state
+change is committed at once, so a restarted worker picks up submitted jobs
+by polling them again instead of resubmitting.
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import threading
+from pathlib import Path
+import requests
+from dotenv import load_dotenv
+import process_with_datalab as datalab
+from checkpoint import file_sha256
+from response_cache import ConversionCache, DEFAULT_CACHE_DIR
+
+# Load environment variables from .env file
+load_dotenv()
+
+MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = 10
+RETRY_MAX_DELAY = 600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    pdf_path TEXT NOT NULL,
+    output_dir TEXT NOT NULL,
+    options TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    polls INTEGER NOT NULL DEFAULT 0,
+    request_id TEXT,
+    check_url TEXT,
+    plan TEXT,  -- JSON: what was sent, recorded at submission (see Worker._plan)
+    submitted_at REAL,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at REAL,
+    UNIQUE (pdf_path, output_dir)
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, next_attempt_at);
+"""
+
+class RetryableError(Exception):
+    """A request failed in a way that is worth retrying later"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """
+    Allow `rate` requests per second on average, with bursts of up to
+    `capacity`. After a 429, pause() stops all requests until the server's
+    Retry-After has passed.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may be sent"""
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    time.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                time.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+def connect(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+def add_jobs(conn, pdf_paths, output_dir, use_llm=False, use_text_layer=True):
+    """Queue PDFs for conversion; PDFs already queued for the same output_dir are skipped. Returns the number added."""
+    options = json.dumps({'use_llm': use_llm, 'use_text_layer': use_text_layer})
+    now = time.time()
+    with conn:
+        added = conn.executemany(
+            "INSERT OR IGNORE INTO jobs (pdf_path, output_dir, options, updated_at) VALUES (?, ?, ?, ?)",
+            [(os.path.abspath(pdf_path), os.path.abspath(output_dir), options, now) for pdf_path in pdf_paths],
+        ).rowcount
+    return added
+
+def queue_status(conn):
+    """Return {status: job count}"""
+    return dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+def retry_delay(attempts, retry_after=None):
+    """Backoff before the next attempt: exponential with jitter, at least the server's Retry-After"""
+    delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempts - 1)) * random.uniform(0.75, 1.25)
+    return max(delay, retry_after or 0)
+
+class Worker:
+    """Drains a job queue within an API rate limit"""
+
+    def __init__(self, conn, api_key, requests_per_minute=60, burst=5, max_in_flight=4,
+                 cache_dir=DEFAULT_CACHE_DIR):
+        self.conn = conn
+        self.headers = {"X-Api-Key": api_key}
+        self.bucket = TokenBucket(requests_per_minute / 60, burst)
+        self.max_in_flight = max_in_flight
+        self.cache = ConversionCache(cache_dir) if cache_dir else None
+        self.session = datalab.get_session()
+
+    def _update(self, job_id, **fields):
+        fields['updated_at'] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self.conn:
+            self.conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def _request(self, method, url, **kwargs):
+        """Send one rate-limited API request and return its JSON; raises RetryableError for transient failures"""
+        self.bucket.acquire()
+        try:
+            response = self.session.request(method, url, headers=self.headers,
+                                            timeout=datalab.REQUEST_TIMEOUT, **kwargs)
+        except requests.exceptions.RequestException as e:
+            raise RetryableError(str(e))
+        if response.status_code in datalab.RETRY_STATUS:
+            retry_after = datalab.retry_after_seconds(response.headers)
+            if response.status_code == 429:
+                self.bucket.pause(retry_after or RETRY_BASE_DELAY)
+            raise RetryableError(f"HTTP {response.status_code}", retry_after)
+        response.raise_for_status()
+        return response.json()
+
+    def _prepare(self, job):
+        """
+        Work out which pages go to the API. Returns the job's plan:
+        text_pages_md, ocr_pages, page_range and cache_key (set by submit()).
+        """
+        options = json.loads(job['options'])
+        text_pages_md, ocr_pages = {}, None
+        if options['use_text_layer']:
+            text_pages_md, ocr_pages = datalab.split_text_layer_pages(job['pdf_path'])
+        page_range = datalab.format_page_range(ocr_pages) if text_pages_md else None
+        return {'text_pages_md': text_pages_md, 'ocr_pages': ocr_pages, 'page_range': page_range, 'cache_key': None}
+
+    def _cache_key(self, job, page_range):
+        options = json.loads(job['options'])
+        return self.cache.key(file_sha256(job['pdf_path']), datalab.API_URL,
+                              datalab.conversion_options(options['use_llm'], page_range))
+
+    def _plan(self, job):
+        """The plan recorded when the job was submitted, so finishing never re-reads the PDF"""
+        plan = json.loads(job['plan'])
+        plan['text_pages_md'] = {int(page): markdown for page, markdown in plan['text_pages_md'].items()}
+        return plan
+
+    def _finish(self, job, check_result, plan):
+        """Write a job's outputs and mark it complete"""
+        if self.cache and plan['cache_key']:
+            self.cache.put(plan['cache_key'], check_result)
+        output_dir = Path(job['output_dir'])
+        output_dir.mkdir(parents=True, exist_ok=True)
+        datalab.save_conversion(check_result, output_dir, Path(job['pdf_path']).stem,
+                                plan['ocr_pages'], plan['text_pages_md'])
+        self._update(job['id'], status='complete', error=None)
+        print(f"[{job['id']}] ✅ Complete: {job['pdf_path']}")
+
+    def _retry(self, job, error, retry_after=None):
+        """Put a job back in the queue after a backoff, or fail it once it is out of attempts"""
+        attempts = job['attempts'] + 1
+        if attempts >= MAX_ATTEMPTS:
+            self._update(job['id'], status='failed', attempts=attempts, error=str(error))
+            print(f"[{job['id']}] ❌ Failed after {attempts} attempts: {error}")
+            return
+        delay = retry_delay(attempts, retry_after)
+        self._update(job['id'], status='pending', attempts=attempts, polls=0, request_id=None, check_url=None,
+                     plan=None, next_attempt_at=time.time() + delay, error=str(error))
+        print(f"[{job['id']}] Retrying in {delay:.0f}s ({error})")
+
+    def _fail(self, job, error):
+        self._update(job['id'], status='failed', error=str(error))
+        print(f"[{job['id']}] ❌ Failed: {error}")
+
+    def submit(self, job):
+        try:
+            plan = self._prepare(job)
+            # Every page has a usable text layer: nothing to send
+            text_only = plan['text_pages_md'] and not plan['ocr_pages']
+            if self.cache and not text_only:
+                plan['cache_key'] = self._cache_key(job, plan['page_range'])
+        except (RuntimeError, OSError) as e:
+            # Missing or unreadable PDF (PyMuPDF's open errors are RuntimeErrors)
+            self._fail(job, e)
+            return
+        text_pages_md, page_range = plan['text_pages_md'], plan['page_range']
+        pdf_path = Path(job['pdf_path'])
+
+        if text_only:
+            output_dir = Path(job['output_dir'])
+            output_dir.mkdir(parents=True, exist_ok=True)
+            with open(output_dir / f"{pdf_path.stem}.md", 'w', encoding='utf-8') as f:
+                f.write(datalab.join_paginated_markdown(sorted(text_pages_md.items())))
+            self._update(job['id'], status='complete', error=None)
+            print(f"[{job['id']}] ✅ Complete (text layer only): {pdf_path}")
+            return
+        if self.cache:
+            check_result = self.cache.get(plan['cache_key'])
+            if check_result is not None:
+                self._finish(job, check_result, plan)
+                return
+
+        use_llm = json.loads(job['options'])['use_llm']
+        fields = {name: (None, str(value))
+                  for name, value in datalab.conversion_options(use_llm, page_range).items()}
+        try:
+            with open(pdf_path, 'rb') as f:
+                data = self._request('POST', datalab.API_URL,
+                                     files={'file': (pdf_path.name, f, 'application/pdf'), **fields})
+        except RetryableError as e:
+            self._retry(job, e, e.retry_after)
+            return
+        except (OSError, requests.exceptions.RequestException, ValueError) as e:
+            # Missing file, or the API rejected the request outright
+            self._fail(job, e)
+            return
+        if not data.get('success'):
+            self._retry(job, data.get('error', 'Unknown error'))
+            return
+
+        self._update(job['id'], status='submitted', request_id=data['request_id'],
+                     check_url=data['request_check_url'], plan=json.dumps(plan, ensure_ascii=False),
+                     submitted_at=time.time(), polls=0,
+                     next_attempt_at=time.time() + datalab.poll_delay(0))
+        print(f"[{job['id']}] Submitted {pdf_path.name}: {data['request_id']}")
+
+    def check(self, job):
+        try:
+            check_result = self._request('GET', job['check_url'])
+        except RetryableError as e:
+            # The job itself is fine; just check again later
+            delay = max(datalab.poll_delay(job['polls']), e.retry_after or 0)
+            self._update(job['id'], next_attempt_at=time.time() + delay)
+            return
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self._retry(job, e)
+            return
+
+        status = check_result.get('status')
+        if status == 'complete':
+            self._finish(job, check_result, self._plan(job))
+        elif status == 'failed':
+            self._retry(job, check_result.get('error', 'conversion failed'))
+        elif time.time() - job['submitted_at'] > datalab.POLL_TIMEOUT:
+            # Only given up on once the server says it is still processing,
+            # so a finished job is never resubmitted after worker downtime
+            self._retry(job, "timed out waiting for conversion")
+        else:
+            polls = job['polls'] + 1
+            self._update(job['id'], polls=polls, next_attempt_at=time.time() + datalab.poll_delay(polls))
+
+    def run(self, idle_exit=True):
+        """Process jobs until none are pending or submitted (or forever if idle_exit is False)"""
+        while True:
+            now = time.time()
+            in_flight = self.conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'submitted'").fetchone()[0]
+            due = self.conn.execute(
+                "SELECT * FROM jobs WHERE next_attempt_at <= ? AND "
+                "(status = 'submitted' OR (status = 'pending' AND ? > 0)) "
+                "ORDER BY status DESC, next_attempt_at, id LIMIT 1",
+                (now, self.max_in_flight - in_flight),
+            ).fetchone()
+            if due is not None:
+                if due['status'] == 'submitted':
+                    self.check(due)
+                else:
+                    self.submit(due)
+                continue
+
+            upcoming = self.conn.execute(
+                "SELECT MIN(next_attempt_at) FROM jobs WHERE status = 'submitted' OR (status = 'pending' AND ? > 0)",
+                (self.max_in_flight - in_flight,),
+            ).fetchone()[0]
+            if upcoming is None and idle_exit:
+                return
+            time.sleep(min(5.0, max(0.05, (upcoming or now + 5) - now)))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Persistent Datalab conversion queue")
+    parser.add_argument("db", help="SQLite queue database (created if missing)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser("add", help="Queue PDFs (files or directories)")
+    add.add_argument("inputs", nargs="+")
+    add.add_argument("--output-dir", required=True)
+    add.add_argument("--use-llm", action="store_true", help="Use LLM for better accuracy (slower, costs more)")
+    add.add_argument("--ocr-all", action="store_true",
+                     help="Send every page to OCR, even pages with a usable text layer")
+
+    run = commands.add_parser("run", help="Drain the queue")
+    run.add_argument("--rate", type=float, default=60, help="API requests per minute (default: 60)")
+    run.add_argument("--burst", type=int, default=5, help="Requests allowed back to back (default: 5)")
+    run.add_argument("--max-in-flight", type=int, default=4, help="Jobs submitted at once (default: 4)")
+    run.add_argument("--no-cache", action="store_true", help="Always call the API, ignoring cached conversions")
+    run.add_argument("--watch", action="store_true", help="Keep running and wait for new jobs")
+
+    commands.add_parser("status", help="Show job counts")
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    if args.command == "add":
+        from datalab_batch import collect_pdfs
+        added = add_jobs(conn, collect_pdfs(args.inputs), args.output_dir,
+                         use_llm=args.use_llm, use_text_layer=not args.ocr_all)
+        print(f"Queued {added} PDFs")
+    elif args.command == "run":
+        api_key = os.getenv("DATALAB_API_KEY")
+        if not api_key:
+            print("ERROR: No API key provided! Set DATALAB_API_KEY.")
+            sys.exit(1)
+        worker = Worker(conn, api_key, requests_per_minute=args.rate, burst=args.burst,
+                        max_in_flight=args.max_in_flight, cache_dir=None if args.no_cache else DEFAULT_CACHE_DIR)
+        worker.run(idle_exit=not args.watch)
+    for status, count in sorted(queue_status(conn).items()):
+        print(f"  {status:<10} {count}")
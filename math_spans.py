@@ -0,0 +1,71 @@
+"""
+Math spans in markdown, found in a single scan.
+Display ($$...$$) math is paired first and inline ($...$) math is only
+looked for in the text between display spans, so delimiters pair up as
+they always have, while the LaTeX cleanup and the MathML converters walk
+the document once and see each formula exactly once.
+"""
+import re
+from dataclasses import dataclass
+
+DISPLAY_RE = re.compile(r'\$\$(.+?)\$\$', re.DOTALL)
+INLINE_RE = re.compile(r'\$([^$]+?)\$')
+
+@dataclass
+class MathSpan:
+    """One formula: its LaTeX source and where it sits in the document"""
+    latex: str
+    display: bool
+    start: int
+    end: int
+
+    @property
+    def delimiter(self):
+        return '$$' if self.display else '$'
+
+    def source(self, latex=None):
+        """The span as markdown, optionally with replacement LaTeX"""
+        return f"{self.delimiter}{self.latex if latex is None else latex}{self.delimiter}"
+
+def _inline_spans(text, start, end):
+    for match in INLINE_RE.finditer(text, start, end):
+        yield MathSpan(match.group(1), False, match.start(), match.end())
+
+def iter_spans(text, inline=True):
+    """Yield the document's MathSpans in order (display spans only if not inline)"""
+    last = 0
+    for match in DISPLAY_RE.finditer(text):
+        if inline:
+            yield from _inline_spans(text, last, match.start())
+        yield MathSpan(match.group(1), True, match.start(), match.end())
+        last = match.end()
+    if inline:
+        yield from _inline_spans(text, last, len(text))
+
+def tokenize_math(text, inline=True):
+    """Yield the document in order as plain-text strings and MathSpan objects"""
+    last = 0
+    for span in iter_spans(text, inline):
+        if span.start > last:
+            yield text[last:span.start]
+        yield span
+        last = span.end
+    if last < len(text):
+        yield text[last:]
+
+def map_math(text, math, plain=None, inline=True):
+    """
+    Rebuild the document, replacing every span with math(span) and every
+    stretch of text between spans with plain(text) (kept as is if None).
+    With inline=False, $...$ is left to plain() as ordinary text.
+    """
+    pieces = []
+    last = 0
+    for span in iter_spans(text, inline):
+        between = text[last:span.start]
+        pieces.append(plain(between) if plain and between else between)
+        pieces.append(math(span))
+        last = span.end
+    tail = text[last:]
+    pieces.append(plain(tail) if plain and tail else tail)
+    return ''.join(pieces)
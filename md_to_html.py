@@ -1,58 +1,138 @@
 import sys
+import html
 import markdown
 from pathlib import Path
 
 import re
+from math_spans import map_math
+from formula_cache import FormulaCache, DEFAULT_CACHE_PATH
 
-def clean_latex(text):
-    """Clean LaTeX to fix common errors and improve Arabic rendering"""
-    
-    # 0. Remove image descriptions (alt text with empty URL)
-    # Pattern: ![Description]()
-    text = re.sub(r'!\[[^\]]*\]\(\)', '', text)
-    
-    # 1. Fix \left without \right
-    # Use regex to avoid matching \rightarrow as \right
-    def fix_delimiters(match):
-        content = match.group(1)
+# Alt text with an empty URL: ![Description]()
+EMPTY_IMAGE_RE = re.compile(r'!\[[^\]]*\]\(\)')
+# \left and \right as commands, not the start of \rightarrow and friends
+DELIMITER_RE = re.compile(r'\\(left|right)(?![a-zA-Z])')
+ARABIC_TEXT_RE = re.compile(r'\\text\{([^\}]*[\u0600-\u06FF]+[^\}]*)\}')
+# Stands in for a prerendered formula while markdown is converted
+MATH_PLACEHOLDER = "mathspan{}x"
+PLACEHOLDER_RE = re.compile(r'(<p>)?mathspan(\d+)x(</p>)?')
+
+# Typeset math in the browser
+MATHJAX_HEAD = """<!-- MathJax for LaTeX rendering -->
+    <script>
+        MathJax = {
+            tex: {
+                inlineMath: [['$', '$']],
+                displayMath: [['$$', '$$']],
+                processEscapes: true,
+                tags: 'ams'
+            },
+            svg: {
+                fontCache: 'global'
+            },
+            output: {
+                font: 'mathjax-modern'
+            }
+        };
+    </script>
+    <script src="https://cdn.jsdelivr.net/npm/mathjax@3/es5/tex-mml-chtml.js" id="MathJax-script" async></script>"""
+
+# Math already rendered to MathML: styling only, no scripts
+STATIC_MATH_HEAD = """<!-- Math prerendered to MathML -->
+    <style>
+        math {
+            direction: ltr;
+            font-family: 'Latin Modern Math', 'STIX Two Math', 'Cambria Math', math;
+        }
         
-        # Count \left and \right only when they are distinct commands
-        # Look for \left followed by non-letter, or end of string
-        left_count = len(re.findall(r'\\left(?![a-zA-Z])', content))
-        right_count = len(re.findall(r'\\right(?![a-zA-Z])', content))
+        .math-display {
+            display: block;
+            direction: ltr;
+            text-align: center;
+            margin: 1em 0;
+            overflow-x: auto;
+        }
         
-        if left_count != right_count:
-            # Replace only exact \left and \right commands
-            content = re.sub(r'\\left(?![a-zA-Z])', '', content)
-            content = re.sub(r'\\right(?![a-zA-Z])', '', content)
-            
-        return f'$${content}$$'
+        .math-error {
+            direction: ltr;
+            color: #c0392b;
+            white-space: pre-wrap;
+        }
+    </style>"""
+
+def remove_empty_images(text):
+    """Remove image descriptions (alt text with an empty URL)"""
+    return EMPTY_IMAGE_RE.sub('', text) if '![' in text else text
+
+def clean_display_math(span):
+    """Fix one $$...$$ span, returning its replacement markdown"""
+    latex = remove_empty_images(span.latex)
     
-    text = re.sub(r'\$\$(.+?)\$\$', fix_delimiters, text, flags=re.DOTALL)
+    # 1. Fix \left without \right
+    commands = DELIMITER_RE.findall(latex)
+    if commands.count('left') != commands.count('right'):
+        latex = DELIMITER_RE.sub('', latex)
     
     # 2. Extract Arabic text from \text{} inside math blocks
     # MathJax sometimes messes up RTL text inside LTR math blocks
-    # We'll try to move it outside the math block if it's at the end
+    # We'll try to move it outside the math block
+    arabic_text_match = ARABIC_TEXT_RE.search(latex)
+    if arabic_text_match:
+        cleaned_math = latex.replace(arabic_text_match.group(0), '')
+        return f'$${cleaned_math}$$ <span dir="rtl">{arabic_text_match.group(1)}</span>'
     
-    def extract_arabic(match):
-        math_content = match.group(1)
-        # Look for \text{...} containing Arabic
-        arabic_text_match = re.search(r'\\text\{([^\}]*[\u0600-\u06FF]+[^\}]*)\}', math_content)
-        
-        if arabic_text_match:
-            arabic_text = arabic_text_match.group(1)
-            # Remove the \text{...} from math
-            cleaned_math = math_content.replace(arabic_text_match.group(0), '')
-            return f'$${cleaned_math}$$ <span dir="rtl">{arabic_text}</span>'
-        
-        return match.group(0)
+    return span.source(latex)
+
+def clean_latex(text):
+    """Clean LaTeX to fix common errors and improve Arabic rendering"""
+    # One pass: display math is fixed and empty image descriptions are
+    # removed everywhere; inline math is plain text here
+    return map_math(text, math=clean_display_math, plain=remove_empty_images, inline=False)
+
+def prerender_math(text, cache):
+    """
+    Render every math span to MathML through the formula cache.
+    Returns (text with placeholders in place of the math, [(markup, display), ...]);
+    the placeholders keep markdown from touching the MathML.
+    """
+    rendered = []
     
-    text = re.sub(r'\$\$(.+?)\$\$', extract_arabic, text, flags=re.DOTALL)
+    def placeholder(span):
+        mathml = cache.render(span.latex, span.display)
+        if mathml is None:
+            markup = f'<code class="math-error">{html.escape(span.source())}</code>'
+        elif span.display:
+            markup = mathml
+        else:
+            markup = f'<span class="math-inline">{mathml}</span>'
+        if span.display:
+            # A span styled as a block, not a <div>: display math can share
+            # a paragraph with text, and a <div> may not sit inside a <p>
+            markup = f'<span class="math-display">{markup}</span>'
+        rendered.append((markup, span.display))
+        return MATH_PLACEHOLDER.format(len(rendered) - 1)
+    
+    return map_math(text, math=placeholder), rendered
+
+def restore_math(html_body, rendered):
+    """Put prerendered formulas back in place of their placeholders"""
+    def restore(match):
+        markup, display = rendered[int(match.group(2))]
+        if display and match.group(1) and match.group(3):
+            # A display formula alone in its paragraph replaces the paragraph
+            return markup
+        return f"{match.group(1) or ''}{markup}{match.group(3) or ''}"
     
-    return text
+    return PLACEHOLDER_RE.sub(restore, html_body)
 
-def convert_md_to_html(md_path, html_path=None):
-    """Convert markdown file to styled HTML with RTL support for Arabic"""
+def convert_md_to_html(md_path, html_path=None, static_math=False, formula_cache=DEFAULT_CACHE_PATH):
+    """
+    Convert markdown file to styled HTML with RTL support for Arabic
+    
+    Args:
+        static_math: Prerender math to MathML instead of loading MathJax,
+            so the page is readable at once and offline (no scripts)
+        formula_cache: SQLite file caching rendered formulas (None: no cache)
+    """
     
     md_path = Path(md_path)
     if html_path is None:
@@ -67,12 +147,20 @@ def convert_md_to_html(md_path, html_path=None):
     # Clean LaTeX
     md_content = clean_latex(md_content)
     
+    rendered = []
+    if static_math:
+        with FormulaCache(formula_cache) as cache:
+            md_content, rendered = prerender_math(md_content, cache)
+        print(f"Prerendered {len(rendered)} formulas ({cache.hits} from cache, {cache.misses} converted)")
+    
     # Convert to HTML (with math support)
     # Use python-markdown-math extension if available, otherwise keep $ delimiters
     try:
         html_body = markdown.markdown(md_content, extensions=['extra', 'nl2br'])
     except:
         html_body = markdown.markdown(md_content, extensions=['extra', 'nl2br'])
+    if rendered:
+        html_body = restore_math(html_body, rendered)
     
     # Create full HTML with styling and MathJax
     html_template = f'''<!DOCTYPE html>
@@ -85,24 +173,7 @@ def convert_md_to_html(md_path, html_path=None):
     <link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
     <link href="https://fonts.googleapis.com/css2?family=Amiri:ital,wght@0,400;0,700;1,400;1,700&family=IBM+Plex+Sans+Arabic:wght@400;700&family=Roboto+Mono:wght@400;700&display=swap" rel="stylesheet">
     
-    <!-- MathJax for LaTeX rendering -->
-    <script>
-        MathJax = {{
-            tex: {{
-                inlineMath: [['$', '$']],
-                displayMath: [['$$', '$$']],
-                processEscapes: true,
-                tags: 'ams'
-            }},
-            svg: {{
-                fontCache: 'global'
-            }},
-            output: {{
-                font: 'mathjax-modern'
-            }}
-        }};
-    </script>
-    <script src="https://cdn.jsdelivr.net/npm/mathjax@3/es5/tex-mml-chtml.js" id="MathJax-script" async></script>
+    {MATHJAX_HEAD if not static_math else STATIC_MATH_HEAD}
     <style>
         body {{
             font-family: 'Amiri', 'Times New Roman', serif;
@@ -222,11 +293,16 @@ def convert_md_to_html(md_path, html_path=None):
     return html_path
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python md_to_html.py <markdown_file> [output_html_file]")
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if not args:
+        print("Usage: python md_to_html.py <markdown_file> [output_html_file] [--static-math] [--no-cache]")
+        print("\nOptions:")
+        print("  --static-math  Prerender math to MathML (no MathJax, works offline)")
+        print("  --no-cache     Do not use the persistent formula cache")
         sys.exit(1)
     
-    md_file = sys.argv[1]
-    html_file = sys.argv[2] if len(sys.argv) > 2 else None
+    md_file = args[0]
+    html_file = args[1] if len(args) > 1 else None
     
-    convert_md_to_html(md_file, html_file)
+    convert_md_to_html(md_file, html_file, static_math='--static-math' in sys.argv,
+                       formula_cache=None if '--no-cache' in sys.argv else DEFAULT_CACHE_PATH)
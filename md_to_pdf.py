@@ -1,38 +1,26 @@
 import sys
-import re
 import markdown
 from pathlib import Path
 from weasyprint import HTML
 from latex2mathml.converter import convert as latex_to_mathml
+from math_spans import map_math
+
+def span_to_mathml(span):
+    """Render one math span as MathML, or as code if the LaTeX does not convert"""
+    try:
+        mathml = latex_to_mathml(span.latex, display="block" if span.display else "inline")
+    except:
+        if span.display:
+            return f'<pre class="math-error">{span.source()}</pre>'
+        return f'<code class="math-error">{span.source()}</code>'
+    if span.display:
+        return f'<div class="math-display">{mathml}</div>'
+    return f'<span class="math-inline">{mathml}</span>'
 
 def convert_latex_to_mathml(text):
     """Convert LaTeX math expressions to MathML for PDF rendering"""
-    
-    def replace_display_math(match):
-        latex = match.group(1)
-        try:
-            mathml = latex_to_mathml(latex, display="block")
-            return f'<div class="math-display">{mathml}</div>'
-        except:
-            # If conversion fails, return as code block
-            return f'<pre class="math-error">$$${latex}$$$</pre>'
-    
-    def replace_inline_math(match):
-        latex = match.group(1)
-        try:
-            mathml = latex_to_mathml(latex, display="inline")
-            return f'<span class="math-inline">{mathml}</span>'
-        except:
-            # If conversion fails, return as code
-            return f'<code class="math-error">${latex}$</code>'
-    
-    # Replace display math ($$...$$)
-    text = re.sub(r'\$\$(.+?)\$\$', replace_display_math, text, flags=re.DOTALL)
-    
-    # Replace inline math ($...$)
-    text = re.sub(r'\$([^\$]+?)\$', replace_inline_math, text)
-    
-    return text
+    # Display ($$...$$) and inline ($...$) math are found in the same pass
+    return map_math(text, math=span_to_mathml)
 
 def convert_md_to_pdf(md_path, pdf_path=None):
     """Convert markdown file to PDF with LaTeX math support"""
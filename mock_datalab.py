@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Datalab marker API, for offline tests and benchmarks.
+Serves the submit (POST /api/v1/marker) and check (GET /api/v1/marker/<id>)
+endpoints with configurable processing latency, failure rate and rate
+limiting (429 + Retry-After). Results are either synthetic (one marker,
+line of text and image per page) or a canned result loaded from a file.
+
+Point the clients at it with DATALAB_API_URL=http://127.0.0.1:8000/api/v1/marker
+"""
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import fitz  # PyMuPDF
+
+API_PATH = "/api/v1/marker"
+# 1x1 PNG used for every synthetic image
+MOCK_IMAGE = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+
+def parse_multipart(content_type, body):
+    """Return {field name: bytes} for a multipart/form-data body"""
+    message = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode('latin-1') + body)
+    return {part.get_param('name', header='content-disposition'): part.get_payload(decode=True)
+            for part in message.iter_parts()}
+
+def parse_page_range(page_range, page_count):
+    """Expand a page_range string like '0-2,5' into 0-indexed pages"""
+    if not page_range:
+        return list(range(page_count))
+    pages = []
+    for part in page_range.split(','):
+        first, _, last = part.partition('-')
+        pages.extend(range(int(first), int(last or first) + 1))
+    return [page for page in pages if page < page_count]
+
+def synthetic_result(pages):
+    """A completed result with one pagination marker, line of text and image per page"""
+    markdown = "\n\n".join(f"{{{page}}}{'-' * 48}\n\nMock text for page {page + 1}\n\n"
+                           f"![](_page_{page}_Figure_1.png)" for page in pages)
+    return {
+        'status': 'complete',
+        'success': True,
+        'markdown': markdown,
+        'images': {f"_page_{page}_Figure_1.png": MOCK_IMAGE for page in pages},
+        'html': None,
+        'page_count': len(pages),
+        'metadata': {'mock': True},
+    }
+
+class MockDatalab:
+    """
+    The mock API server. Settings can be changed between runs:
+        latency: seconds from submission until a job completes
+        page_latency: extra seconds per page
+        failure_rate: share of jobs that end as 'failed'
+        rate_limit: share of requests answered with 429 + Retry-After
+        retry_after: seconds sent in Retry-After
+        canned: a completed result returned for every job (None: synthetic)
+    """
+
+    def __init__(self, host="127.0.0.1", port=8000, latency=2.0, page_latency=0.0,
+                 failure_rate=0.0, rate_limit=0.0, retry_after=1, canned=None):
+        self.latency = latency
+        self.page_latency = page_latency
+        self.failure_rate = failure_rate
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.canned = canned
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.reset_stats()
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+
+    @property
+    def api_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}{API_PATH}"
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {'submits': 0, 'checks': 0, 'rate_limited': 0, 'completed': 0, 'failed': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def start(self):
+        """Serve on a background thread; returns self"""
+        threading.Thread(target=self.server.serve_forever, name="mock-datalab", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def submit(self, fields):
+        pdf_bytes = fields.get('file') or b''
+        try:
+            with fitz.open(stream=pdf_bytes, filetype='pdf') as doc:
+                page_count = len(doc)
+        except Exception:
+            return 400, {'success': False, 'error': 'file is not a PDF'}
+
+        page_range = (fields.get('page_range') or b'').decode()
+        pages = parse_page_range(page_range, page_count)
+        request_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._jobs[request_id] = {
+                'ready_at': time.monotonic() + self.latency + self.page_latency * len(pages),
+                'fails': random.random() < self.failure_rate,
+                'pages': pages,
+            }
+        self._count('submits')
+        return 200, {
+            'success': True,
+            'request_id': request_id,
+            'request_check_url': f"{self.api_url}/{request_id}",
+        }
+
+    def check(self, request_id):
+        self._count('checks')
+        with self._lock:
+            job = self._jobs.get(request_id)
+        if job is None:
+            return 404, {'success': False, 'error': 'unknown request_id'}
+        if time.monotonic() < job['ready_at']:
+            return 200, {'status': 'processing'}
+        if job['fails']:
+            self._count('failed')
+            return 200, {'status': 'failed', 'success': False, 'error': 'Mock conversion failure'}
+        self._count('completed')
+        return 200, self.canned if self.canned is not None else synthetic_result(job['pages'])
+
+    def _handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, status, payload, headers=()):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _rate_limited(self):
+                if random.random() < api.rate_limit:
+                    api._count('rate_limited')
+                    self._reply(429, {'success': False, 'error': 'Rate limit exceeded'},
+                                [('Retry-After', str(api.retry_after))])
+                    return True
+                return False
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if self.path.rstrip('/') != API_PATH:
+                    return self._reply(404, {'success': False, 'error': 'not found'})
+                if self._rate_limited():
+                    return
+                fields = parse_multipart(self.headers.get('Content-Type', ''), body)
+                self._reply(*api.submit(fields))
+
+            def do_GET(self):
+                if not self.path.startswith(API_PATH + "/"):
+                    return self._reply(404, {'success': False, 'error': 'not found'})
+                if self._rate_limited():
+                    return
+                self._reply(*api.check(self.path[len(API_PATH) + 1:]))
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+def load_canned(path):
+    """Load a completed result: a saved status response, or the chunk file of an unfinished run"""
+    with open(path, 'r', encoding='utf-8') as f:
+        result = json.load(f)
+    return result.get('result', result)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the Datalab marker API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=2.0, help="Seconds until a job completes (default: 2)")
+    parser.add_argument("--page-latency", type=float, default=0.0, help="Extra seconds per page (default: 0)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of jobs that fail (default: 0)")
+    parser.add_argument("--rate-limit", type=float, default=0.0,
+                        help="Share of requests answered with 429 (default: 0)")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429 (default: 1)")
+    parser.add_argument("--canned", help="JSON file with a completed result to return for every job")
+    args = parser.parse_args()
+
+    api = MockDatalab(args.host, args.port, latency=args.latency, page_latency=args.page_latency,
+                      failure_rate=args.failure_rate, rate_limit=args.rate_limit,
+                      retry_after=args.retry_after, canned=load_canned(args.canned) if args.canned else None)
+    print(f"Mock Datalab API at {api.api_url}")
+    print(f"Use it with: DATALAB_API_URL={api.api_url}")
+    try:
+        api.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,65 @@
+"""
+Process-wide registry of lazily loaded OCR models.
+Importing this module (or anything that uses it) loads nothing; each model is
+built the first time get_model() asks for it and reused afterwards.
+"""
+import threading
+
+# Model name -> zero-argument factory; paddleocr is only imported inside them
+_factories = {}
+_models = {}
+_lock = threading.Lock()
+
+def register_model(name, factory):
+    """Register (or replace) the factory used to build a model on first use"""
+    with _lock:
+        _factories[name] = factory
+        _models.pop(name, None)
+
+def get_model(name):
+    """Return the named model, loading it on first use"""
+    model = _models.get(name)
+    if model is not None:
+        return model
+
+    with _lock:
+        # Another thread may have loaded it while we waited
+        if name not in _models:
+            if name not in _factories:
+                raise KeyError(f"Unknown model '{name}', expected one of {sorted(_factories)}")
+            _models[name] = _factories[name]()
+        return _models[name]
+
+def warm_models(*names):
+    """Load models ahead of time (all registered models if no names are given)"""
+    for name in names or list(_factories):
+        get_model(name)
+
+def is_loaded(name):
+    return name in _models
+
+def _paddle_ocr():
+    from paddleocr import PaddleOCR
+    return PaddleOCR(use_angle_cls=True, lang='ar')
+
+def _pp_structure():
+    from paddleocr import PPStructureV3
+    return PPStructureV3()
+
+def _text_detection():
+    from paddleocr import TextDetection
+    return TextDetection(model_name="PP-OCRv5_mobile_det")
+
+def _textline_orientation():
+    from paddleocr import TextLineOrientationClassification
+    return TextLineOrientationClassification(model_name="PP-LCNet_x0_25_textline_ori")
+
+def _text_recognition():
+    from paddleocr import TextRecognition
+    return TextRecognition(model_name="arabic_PP-OCRv5_mobile_rec")
+
+register_model('ocr', _paddle_ocr)
+register_model('structure', _pp_structure)
+register_model('text_detection', _text_detection)
+register_model('textline_orientation', _textline_orientation)
+register_model('text_recognition', _text_recognition)
@@ -0,0 +1,100 @@
+"""
+Persistent, content-addressed cache of per-page OCR results.
+Entries are keyed by a hash of the rasterized page plus the OCR engine and
+its configuration, so re-running a document skips OCR for every page that
+was already recognized. Old entries are evicted least-recently-used first
+once the cache grows past its size cap.
+"""
+import os
+import hashlib
+import zipfile
+from pathlib import Path
+from importlib import metadata
+import numpy as np
+from disk_cache import DiskCache
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "ocr-chandra" / "ocr_pages"
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024  # 1 GB
+# What np.load raises for a truncated or corrupt .npz entry
+CORRUPT_ENTRY_ERRORS = (ValueError, KeyError, EOFError, zipfile.BadZipFile)
+
+def engine_config(*settings):
+    """Describe the OCR engine for cache keys: paddleocr version plus the given settings"""
+    try:
+        version = metadata.version('paddleocr')
+    except metadata.PackageNotFoundError:
+        version = 'unknown'
+    return '|'.join([f"paddleocr={version}", *map(str, settings)])
+
+class OCRCache(DiskCache):
+    """On-disk OCR result cache with a size cap and LRU eviction"""
+
+    suffix = ".npz"
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        super().__init__(cache_dir, max_bytes)
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, pixels, config):
+        """Return the cache key for a rendered page under an engine configuration"""
+        pixels = np.ascontiguousarray(pixels)
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(config.encode('utf-8'))
+        digest.update(str(pixels.shape).encode('ascii'))
+        digest.update(pixels.data)
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Look up a page. Returns (found, lines) where lines is the cached
+        extract_lines() output (None for a page with no text).
+        """
+        path = self._path(key)
+        try:
+            with np.load(path) as entry:
+                lines = decode_lines(entry)
+        except OSError:
+            self.misses += 1
+            return False, None
+        except CORRUPT_ENTRY_ERRORS:
+            # Drop the damaged entry; the page is recognized and stored again
+            self._discard(path)
+            self.misses += 1
+            return False, None
+
+        # Mark as recently used for LRU eviction
+        os.utime(path)
+        self.hits += 1
+        return True, lines
+
+    def put(self, key, lines):
+        """Store a page's extract_lines() output (None for a page with no text)"""
+        self._store(key, lambda f: np.savez(f, **encode_lines(lines)))
+
+def encode_lines(lines):
+    """Pack rec_texts/rec_scores/rec_boxes into flat arrays (texts as one UTF-8 blob + offsets)"""
+    if lines is None:
+        lines = {'rec_texts': [], 'rec_scores': [], 'rec_boxes': np.zeros((0, 4))}
+
+    encoded = [text.encode('utf-8') for text in lines['rec_texts']]
+    offsets = np.cumsum([0] + [len(text) for text in encoded], dtype=np.int64)
+    return {
+        'text_bytes': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+        'text_offsets': offsets,
+        'scores': np.asarray(lines['rec_scores'], dtype=np.float32),
+        'boxes': np.asarray(lines['rec_boxes'], dtype=np.int32).reshape(-1, 4),
+    }
+
+def decode_lines(entry):
+    offsets = entry['text_offsets']
+    if len(offsets) <= 1:
+        return None
+
+    blob = entry['text_bytes'].tobytes()
+    texts = [blob[start:end].decode('utf-8') for start, end in zip(offsets[:-1], offsets[1:])]
+    return {
+        'rec_texts': texts,
+        'rec_scores': entry['scores'].tolist(),
+        'rec_boxes': entry['boxes'],
+    }
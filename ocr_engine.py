@@ -0,0 +1,216 @@
+"""
+OCR stage for the local PaddleOCR pipeline.
+Pages can be recognized in-process, spread across a pool of worker
+processes (each holding its own PaddleOCR model), or batched so that text
+lines from several pages share the same recognition batches.
+"""
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+import cv2
+import numpy as np
+from models import get_model, warm_models
+from ocr_cache import engine_config
+
+# Cache configurations of the two recognition paths (they produce different results)
+PIPELINE_CONFIG = "PaddleOCR(use_angle_cls=True, lang='ar')"
+BATCHED_CONFIG = "batched:text_detection+textline_orientation+text_recognition"
+
+# Upper bound on pages held by ocr_pages_batched(), e.g. for runs of blank or cached pages
+MAX_WINDOW_PAGES = 16
+
+def extract_lines(result):
+    """
+    Reduce a PaddleOCR result to the fields the writers need.
+    Returns a dict with rec_texts, rec_scores and rec_boxes ([xmin, ymin, xmax, ymax]),
+    or None if nothing was recognized. Unlike the raw result it carries no
+    images, so it is cheap to send between processes.
+    """
+    res = result[0] if result else None
+    if not res or 'rec_texts' not in res:
+        return None
+    return {
+        'rec_texts': list(res['rec_texts']),
+        'rec_scores': list(res['rec_scores']),
+        'rec_boxes': np.asarray(res['rec_boxes']),
+    }
+
+def _lookup(cache, config, known_lines, page_index, pixels):
+    """
+    Return (key, found, lines) for a page from its embedded text layer or the cache.
+    key is the cache key to store fresh OCR results under (None when not caching).
+    """
+    if known_lines and page_index in known_lines:
+        return None, True, known_lines[page_index]
+    if cache is None:
+        return None, False, None
+    key = cache.key(pixels, config)
+    found, lines = cache.get(key)
+    return key, found, lines
+
+def _init_worker():
+    # Load the worker's own model before its first page arrives
+    warm_models('ocr')
+
+def _ocr_in_worker(pixels):
+    return extract_lines(get_model('ocr').ocr(pixels))
+
+def ocr_pages(pages, ocr=None, workers=1, cache=None, known_lines=None):
+    """
+    Run OCR over (page_index, pixels) pairs.
+    Yields (page_index, pixels, lines) in page order, where lines is the
+    output of extract_lines().
+
+    Args:
+        pages: Iterable of (page_index, pixels), e.g. rasterizer.render_pages()
+        ocr: PaddleOCR model used when workers <= 1 (default: the shared 'ocr' model)
+        workers: Number of worker processes; each loads its own model once
+        cache: Optional OCRCache; pages found in it are not OCR'd again
+        known_lines: Optional {page_index: lines} for pages that need no OCR,
+            e.g. from text_layer.extract_text_layers()
+    """
+    config = engine_config(PIPELINE_CONFIG)
+
+    if workers <= 1:
+        for page_index, pixels in pages:
+            key, found, lines = _lookup(cache, config, known_lines, page_index, pixels)
+            if not found:
+                ocr = ocr or get_model('ocr')
+                lines = extract_lines(ocr.ocr(pixels))
+                if key is not None:
+                    cache.put(key, lines)
+            yield page_index, pixels, lines
+        return
+
+    # Keep a bounded number of pages in flight so memory stays flat
+    max_pending = workers * 2
+    pending = deque()
+    context = multiprocessing.get_context('spawn')
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker) as pool:
+        for page_index, pixels in pages:
+            # Rasterizer arrays are views that die with the next page
+            pixels = pixels.copy()
+            key, found, lines = _lookup(cache, config, known_lines, page_index, pixels)
+            if found:
+                # Known pages wait in line so results stay in page order
+                future = Future()
+                future.set_result(lines)
+                key = None
+            else:
+                future = pool.submit(_ocr_in_worker, pixels)
+            pending.append((page_index, pixels, key, future))
+
+            if len(pending) >= max_pending:
+                yield _finish_pending(pending.popleft(), cache)
+
+        while pending:
+            yield _finish_pending(pending.popleft(), cache)
+
+def _finish_pending(entry, cache):
+    """Wait for a pooled page, store fresh results in the cache and return (page_index, pixels, lines)"""
+    page_index, pixels, key, future = entry
+    lines = future.result()
+    if key is not None:
+        cache.put(key, lines)
+    return page_index, pixels, lines
+
+def get_batched_models():
+    """Return the separate detection, orientation and recognition models for ocr_pages_batched()"""
+    return {
+        'det': get_model('text_detection'),
+        'ori': get_model('textline_orientation'),
+        'rec': get_model('text_recognition'),
+    }
+
+def crop_line(pixels, quad):
+    """Cut a detected text line (4-point polygon) out of the page as an upright image"""
+    quad = np.asarray(quad, dtype=np.float32)
+    width = int(max(np.linalg.norm(quad[0] - quad[1]), np.linalg.norm(quad[2] - quad[3])))
+    height = int(max(np.linalg.norm(quad[0] - quad[3]), np.linalg.norm(quad[1] - quad[2])))
+    target = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+    matrix = cv2.getPerspectiveTransform(quad, target)
+    crop = cv2.warpPerspective(pixels, matrix, (width, height),
+                               borderMode=cv2.BORDER_REPLICATE, flags=cv2.INTER_CUBIC)
+    # Vertical lines are recognized rotated, as PaddleOCR does
+    if height >= 1.5 * width:
+        crop = np.rot90(crop)
+    return crop
+
+def _detect_lines(models, pixels):
+    """Return the page's text-line polygons as an (N, 4, 2) array in reading order (top to bottom)"""
+    result = next(iter(models['det'].predict(pixels, batch_size=1)))
+    quads = np.asarray(result['dt_polys'], dtype=np.float32).reshape(-1, 4, 2)
+    order = np.lexsort((quads[:, 0, 0], quads[:, 0, 1]))
+    return quads[order]
+
+def _recognize_window(models, window, batch_size, cache):
+    """Recognize every crop in the window in shared batches and split the results back per page"""
+    crops = [crop for _, _, _, _, page_crops, _ in window for crop in page_crops]
+    texts, scores = [], []
+
+    if crops:
+        for i, result in enumerate(models['ori'].predict(crops, batch_size=batch_size)):
+            if result['label_names'][0] == '180_degree':
+                crops[i] = np.rot90(crops[i], 2)
+
+        for result in models['rec'].predict(crops, batch_size=batch_size):
+            texts.append(result['rec_text'])
+            scores.append(float(result['rec_score']))
+
+    offset = 0
+    for page_index, pixels, key, quads, page_crops, cached_lines in window:
+        if quads is None:
+            yield page_index, pixels, cached_lines
+            continue
+
+        count = len(page_crops)
+        lines = None
+        if count:
+            boxes = np.concatenate([quads.min(axis=1), quads.max(axis=1)], axis=1).astype(int)
+            lines = {
+                'rec_texts': texts[offset:offset + count],
+                'rec_scores': scores[offset:offset + count],
+                'rec_boxes': boxes,
+            }
+            offset += count
+
+        if key is not None:
+            cache.put(key, lines)
+        yield page_index, pixels, lines
+
+def ocr_pages_batched(pages, models=None, batch_size=64, cache=None, known_lines=None):
+    """
+    Run OCR over (page_index, pixels) pairs, recognizing text lines from
+    several pages together. Pages are detected one at a time and their line
+    crops are queued until at least `batch_size` lines (or MAX_WINDOW_PAGES
+    pages) are waiting; the whole window is then recognized in batches of `batch_size`.
+    Larger batches raise throughput at the cost of latency before the first page.
+
+    Yields (page_index, pixels, lines) in page order, like ocr_pages().
+    Pages found in `known_lines` or `cache` (as in ocr_pages()) skip detection
+    and recognition.
+    """
+    config = engine_config(BATCHED_CONFIG)
+    window = []
+    pending_lines = 0
+
+    for page_index, pixels in pages:
+        # Held until its window is recognized, past the rasterizer's next page
+        pixels = pixels.copy()
+        key, found, lines = _lookup(cache, config, known_lines, page_index, pixels)
+        if found:
+            window.append((page_index, pixels, None, None, [], lines))
+        else:
+            models = models or get_batched_models()
+            quads = _detect_lines(models, pixels)
+            page_crops = [crop_line(pixels, quad) for quad in quads]
+            window.append((page_index, pixels, key, quads, page_crops, None))
+            pending_lines += len(page_crops)
+
+        if pending_lines >= batch_size or len(window) >= MAX_WINDOW_PAGES:
+            yield from _recognize_window(models, window, batch_size, cache)
+            window, pending_lines = [], 0
+
+    if window:
+        yield from _recognize_window(models, window, batch_size, cache)
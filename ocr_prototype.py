@@ -1,28 +1,25 @@
-from paddleocr import PaddleOCR
-from pdf2image import convert_from_path
 from PIL import Image, ImageDraw
 import sys
-import numpy as np
-
-# Initialize PaddleOCR
-ocr = PaddleOCR(use_angle_cls=True, lang='ar')
+from rasterizer import get_page_count, render_pages
+from models import get_model
 
 def process_pdf(pdf_path):
     print(f"Processing {pdf_path}...")
     
     try:
-        images = convert_from_path(pdf_path)
+        page_count = get_page_count(pdf_path)
     except Exception as e:
         print(f"Error converting PDF: {e}")
         return
 
-    print(f"PDF has {len(images)} pages.")
+    print(f"PDF has {page_count} pages.")
     
-    if images:
-        image = images[0]
+    for _, pixels in render_pages(pdf_path, first_page=1, last_page=1):
+        image = Image.fromarray(pixels)
         print("Running OCR on page 1...")
         
-        result = ocr.ocr(np.array(image))
+        # PaddleOCR is loaded on first use
+        result = get_model('ocr').ocr(pixels)
         
         # New PaddleOCR format seems to be a list containing a dict
         res = result[0]
@@ -62,5 +59,4 @@ if __name__ == "__main__":
     if len(sys.argv) < 2:
         print("Usage: python ocr_prototype.py <pdf_path>")
     else:
-        import numpy as np # Need numpy for image conversion
         process_pdf(sys.argv[1])
@@ -0,0 +1,74 @@
+"""
+Array-backed per-page OCR result shared by the output writers.
+Filtering, geometry and script detection run once per page over whole
+NumPy arrays instead of line by line inside every writer.
+"""
+import re
+from dataclasses import dataclass
+import numpy as np
+
+# Lines at or below this confidence are treated as noise
+SCORE_THRESHOLD = 0.75
+# Font size as a fraction of the text box height
+FONT_SCALE = 0.75
+
+ARABIC_RE = re.compile(r'[\u0600-\u06FF]')
+
+@dataclass
+class PageResult:
+    """
+    Lines kept on one page, with geometry in raster pixels (top-left origin).
+    All arrays are indexed like `texts`.
+    """
+    page_index: int
+    width: int
+    height: int
+    texts: list
+    scores: np.ndarray      # (N,) float32
+    boxes: np.ndarray       # (N, 4) [xmin, ymin, xmax, ymax]
+    font_sizes: np.ndarray  # (N,) in pixels
+    is_rtl: np.ndarray      # (N,) bool, True for lines containing Arabic
+    from_text_layer: bool = False
+
+    def __len__(self):
+        return len(self.texts)
+
+    @property
+    def origins(self):
+        """Baseline start of each line (box bottom-left), top-left origin"""
+        return self.boxes[:, [0, 3]]
+
+    @property
+    def flipped_origins(self):
+        """Baseline start of each line with a bottom-left origin, as reportlab expects"""
+        return np.column_stack([self.boxes[:, 0], self.height - self.boxes[:, 3]])
+
+def build_page_result(page_index, width, height, lines, threshold=SCORE_THRESHOLD, from_text_layer=False):
+    """
+    Turn extract_lines() output into a PageResult.
+    Returns None when nothing was recognized on the page, and a PageResult
+    (possibly with no lines) otherwise.
+    """
+    if not lines:
+        return None
+
+    scores = np.asarray(lines['rec_scores'], dtype=np.float32)
+    boxes = np.asarray(lines['rec_boxes']).reshape(-1, 4)
+
+    keep = np.flatnonzero(scores > threshold)
+    all_texts = lines['rec_texts']
+    texts = [all_texts[i] for i in keep]
+    boxes = boxes[keep]
+
+    return PageResult(
+        page_index=page_index,
+        width=width,
+        height=height,
+        texts=texts,
+        scores=scores[keep],
+        boxes=boxes,
+        font_sizes=(boxes[:, 3] - boxes[:, 1]) * FONT_SCALE,
+        is_rtl=np.fromiter((ARABIC_RE.search(text) is not None for text in texts),
+                           dtype=bool, count=len(texts)),
+        from_text_layer=from_text_layer,
+    )
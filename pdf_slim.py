@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Shrink a PDF before uploading it for OCR.
+Embedded images scanned at more than the target resolution are downsampled
+(OCR gains nothing from pixels above ~200 DPI), invisible text layers left
+by an earlier OCR pass are removed from pages with no visible text (the API
+is told to strip them anyway),
+and the file is rewritten with unused objects dropped and streams deflated.
+"""
+import sys
+import math
+import argparse
+import fitz  # PyMuPDF
+from text_layer import invisible_text_ratio
+
+DEFAULT_TARGET_DPI = 200
+# Only images this much above the target are worth re-encoding
+DPI_THRESHOLD_FACTOR = 1.25
+JPEG_QUALITY = 85
+# Assumed upload bandwidth for the time estimate in reports
+UPLOAD_MBPS = 10
+
+def image_resolutions(doc):
+    """Return {xref: dpi}: the highest resolution each image is drawn at"""
+    resolutions = {}
+    for page in doc:
+        for info in page.get_image_info(xrefs=True):
+            # The placement matrix maps the image's unit square onto the page; the
+            # lengths of its axes are the drawn width and height, however rotated
+            a, b, c, d, _, _ = info['transform']
+            drawn_width, drawn_height = math.hypot(a, b), math.hypot(c, d)
+            if not info['xref'] or not drawn_width or not drawn_height:
+                continue
+            dpi = max(info['width'] / (drawn_width / 72), info['height'] / (drawn_height / 72))
+            resolutions[info['xref']] = max(dpi, resolutions.get(info['xref'], 0))
+    return resolutions
+
+def downsample_images(doc, target_dpi, jpeg_quality=JPEG_QUALITY):
+    """
+    Re-encode colour and greyscale images drawn above the target resolution
+    as smaller JPEGs. Bilevel scans (CCITT, JBIG2) are already compact and
+    are left alone, as are images with transparency. Returns the count rewritten.
+    """
+    threshold = target_dpi * DPI_THRESHOLD_FACTOR
+    rewritten = 0
+    for xref, dpi in image_resolutions(doc).items():
+        if dpi <= threshold:
+            continue
+        info = doc.extract_image(xref)
+        if info.get('smask') or info['bpc'] < 8:
+            continue
+
+        pix = fitz.Pixmap(doc, xref)
+        if pix.colorspace is None or pix.colorspace.n not in (1, 3):
+            pix = fitz.Pixmap(fitz.csRGB, pix)
+        scale = target_dpi / dpi
+        small = fitz.Pixmap(pix, max(1, round(pix.width * scale)), max(1, round(pix.height * scale)), None)
+        jpeg = small.tobytes('jpeg', jpg_quality=jpeg_quality)
+        if len(jpeg) >= len(doc.xref_stream_raw(xref)):
+            continue
+
+        # Swap the stream in place, so every page drawing this image gets the smaller one
+        doc.update_stream(xref, jpeg, compress=False)
+        doc.xref_set_key(xref, "Filter", "/DCTDecode")
+        doc.xref_set_key(xref, "DecodeParms", "null")
+        doc.xref_set_key(xref, "Decode", "null")
+        doc.xref_set_key(xref, "Width", str(small.width))
+        doc.xref_set_key(xref, "Height", str(small.height))
+        doc.xref_set_key(xref, "BitsPerComponent", "8")
+        doc.xref_set_key(xref, "ColorSpace", "/DeviceGray" if small.n == 1 else "/DeviceRGB")
+        rewritten += 1
+    return rewritten
+
+def slim_pdf(source, target_dpi=DEFAULT_TARGET_DPI, strip_ocr=True, jpeg_quality=JPEG_QUALITY):
+    """
+    Return (pdf_bytes, report) for a slimmed copy of `source` (a path or PDF
+    bytes). The original bytes are returned if slimming would not make the
+    file smaller. report holds original_bytes, slim_bytes,
+    images_downsampled and ocr_pages_stripped.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        original = bytes(source)
+    else:
+        with open(source, 'rb') as f:
+            original = f.read()
+
+    stripped = 0
+    with fitz.open(stream=original, filetype='pdf') as doc:
+        if strip_ocr:
+            for page in doc:
+                # Redaction removes every glyph in its area, so pages that also
+                # carry visible text keep their OCR layer
+                if invisible_text_ratio(page) == 1.0:
+                    # Remove the text only; images and vector graphics stay untouched
+                    page.add_redact_annot(page.rect)
+                    page.apply_redactions(images=fitz.PDF_REDACT_IMAGE_NONE,
+                                          graphics=fitz.PDF_REDACT_LINE_ART_NONE,
+                                          text=fitz.PDF_REDACT_TEXT_REMOVE)
+                    stripped += 1
+        downsampled = downsample_images(doc, target_dpi, jpeg_quality) if target_dpi else 0
+        slim = doc.tobytes(garbage=4, deflate=True, deflate_images=True, deflate_fonts=True, use_objstms=True)
+
+    if len(slim) >= len(original):
+        slim = original
+    return slim, {'original_bytes': len(original), 'slim_bytes': len(slim),
+                  'images_downsampled': downsampled, 'ocr_pages_stripped': stripped}
+
+def format_report(report, upload_mbps=UPLOAD_MBPS):
+    """One-line summary of a slim_pdf() report, with the upload time saved at `upload_mbps`"""
+    original, slim = report['original_bytes'], report['slim_bytes']
+    saved = original - slim
+    seconds_saved = saved * 8 / (upload_mbps * 1_000_000)
+    line = (f"Slimmed PDF: {original / 1e6:.2f} MB -> {slim / 1e6:.2f} MB "
+            f"({saved / original:.0%} smaller, ~{seconds_saved:.1f}s less upload at {upload_mbps} Mbit/s)")
+    if report['images_downsampled']:
+        line += f", {report['images_downsampled']} images downsampled"
+    if report['ocr_pages_stripped']:
+        line += f", OCR layer removed from {report['ocr_pages_stripped']} pages"
+    return line
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shrink a PDF before uploading it for OCR")
+    parser.add_argument("pdf_path")
+    parser.add_argument("output_path", nargs="?", help="Where to write the slimmed PDF (default: report only)")
+    parser.add_argument("--dpi", type=int, default=DEFAULT_TARGET_DPI,
+                        help=f"Downsample images above this resolution (default: {DEFAULT_TARGET_DPI}, 0 to keep)")
+    parser.add_argument("--keep-ocr", action="store_true", help="Keep existing invisible OCR text")
+    args = parser.parse_args()
+
+    pdf_bytes, report = slim_pdf(args.pdf_path, target_dpi=args.dpi, strip_ocr=not args.keep_ocr)
+    print(format_report(report))
+    if args.output_path:
+        with open(args.output_path, 'wb') as f:
+            f.write(pdf_bytes)
+        print(f"Saved: {args.output_path}")
+    sys.exit(0)
@@ -1,56 +1,40 @@
 import os
-import sys
-import numpy as np
-from paddleocr import PaddleOCR
-from pdf2image import convert_from_path
-from PIL import Image, ImageDraw
-from docx import Document
-from docx.shared import Pt
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-import arabic_reshaper
-from bidi.algorithm import get_display
-import fitz  # PyMuPDF
-
-# Initialize PaddleOCR
-ocr = PaddleOCR(use_angle_cls=True, lang='ar')
+import argparse
+from PIL import Image
+from rasterizer import get_page_count, render_pages
+from ocr_engine import ocr_pages, ocr_pages_batched, PIPELINE_CONFIG, BATCHED_CONFIG
+from ocr_cache import OCRCache, DEFAULT_CACHE_DIR, engine_config
+from checkpoint import RunCheckpoint, file_sha256
+from text_layer import extract_text_layers
+from page_result import build_page_result
+from writers import WRITERS, OUTPUT_FORMATS, WriterPool
+from shaping import shaping_stats
+from image_extractor import extract_images_from_pdf
 
 def create_directory(path):
     if not os.path.exists(path):
         os.makedirs(path)
 
-def extract_images_from_pdf(pdf_path, output_dir):
-    """Extract all images from PDF using PyMuPDF"""
-    create_directory(output_dir)
-    doc = fitz.open(pdf_path)
-    image_count = 0
-    
-    for page_num in range(len(doc)):
-        page = doc[page_num]
-        image_list = page.get_images()
-        
-        for img_index, img in enumerate(image_list):
-            xref = img[0]
-            base_image = doc.extract_image(xref)
-            image_bytes = base_image["image"]
-            image_ext = base_image["ext"]
-            
-            image_filename = f"page{page_num+1}_img{img_index+1}.{image_ext}"
-            image_path = os.path.join(output_dir, image_filename)
-            
-            with open(image_path, "wb") as img_file:
-                img_file.write(image_bytes)
-            
-            image_count += 1
-            print(f"  Extracted: {image_filename}")
-    
-    print(f"Total images extracted: {image_count}")
-    return image_count
+def process_pdf_to_formats(pdf_path, output_dir, dpi=200, workers=1, batch_size=0, pdf_mode='raster',
+                           cache_dir=DEFAULT_CACHE_DIR, use_text_layer=True, formats=OUTPUT_FORMATS,
+                           resume=False):
+    """
+    OCR a PDF into Word, HTML and a searchable PDF.
+
+    formats selects the outputs ('docx', 'html', 'pdf'); writers that are
+    not selected are never created.
+
+    pdf_mode selects how the searchable PDF is built:
+        'raster': redraw every rendered page as an image with reportlab and add invisible text
+        'overlay': add the invisible text layer to the original PDF pages in place
 
-def process_pdf_to_formats(pdf_path, output_dir):
+    OCR results are cached per page in cache_dir (None disables the cache).
+    With use_text_layer, pages with a trustworthy embedded text layer use
+    that text directly and skip OCR.
+
+    Every OCR'd page is checkpointed in <output_dir>/<name>_run. With resume,
+    an interrupted run picks up from its checkpoints instead of starting over.
+    """
     create_directory(output_dir)
     base_name = os.path.splitext(os.path.basename(pdf_path))[0]
     
@@ -61,159 +45,111 @@ def process_pdf_to_formats(pdf_path, output_dir):
     
     print(f"\n=== Converting PDF to images for OCR ===")
     try:
-        images = convert_from_path(pdf_path)
+        page_count = get_page_count(pdf_path)
     except Exception as e:
         print(f"Error converting PDF: {e}")
         return
 
-    # Initialize Word Document
-    doc = Document()
-    
-    # Initialize HTML content
-    html_content = []
-    
-    # Initialize Searchable PDF
-    pdf_output_path = os.path.join(output_dir, f"{base_name}_searchable.pdf")
-    c = canvas.Canvas(pdf_output_path, pagesize=A4)
-    
-    # Register Arabic font for PDF
-    font_path = '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
-    if os.path.exists(font_path):
-        pdfmetrics.registerFont(TTFont('DejaVuSans', font_path))
+    # One writer per requested output, running on its own thread where it is safe to
+    writer_keys = ['pdf-overlay' if fmt == 'pdf' and pdf_mode == 'overlay' else fmt for fmt in formats]
+    writers = WriterPool([WRITERS[key](pdf_path, output_dir, base_name, page_count, dpi=dpi)
+                          for key in writer_keys])
+
+    text_layers = {}
+    if use_text_layer:
+        text_layers = extract_text_layers(pdf_path, dpi=dpi)
+        print(f"Using embedded text on {len(text_layers)}/{page_count} pages, OCR on the rest")
+
+    # Per-page checkpoints; reused only for the same PDF and OCR settings
+    checkpoint = RunCheckpoint(os.path.join(output_dir, f"{base_name}_run"))
+    settings = {
+        'pdf_sha256': file_sha256(pdf_path),
+        'dpi': dpi,
+        'engine': engine_config(BATCHED_CONFIG if batch_size > 0 else PIPELINE_CONFIG),
+    }
+    known_lines = dict(text_layers)
+    if checkpoint.open(settings, resume=resume):
+        checkpointed = checkpoint.load_pages()
+        print(f"Resuming: {len(checkpointed)}/{page_count} pages already recognized")
+        known_lines.update(checkpointed)
+
+    cache = OCRCache(cache_dir) if cache_dir else None
+    # Always RGB: PIL copies RGB arrays, so images handed to writer threads outlive the render
+    pages = render_pages(pdf_path, dpi=dpi, colorspace='rgb')
+    if batch_size > 0:
+        print(f"Running batched OCR (batch size {batch_size})")
+        ocr_results = ocr_pages_batched(pages, batch_size=batch_size, cache=cache,
+                                        known_lines=known_lines)
     else:
-        print("Warning: DejaVuSans font not found. PDF text might not render correctly.")
+        # PaddleOCR loads on first use (pool workers load their own model)
+        if workers > 1:
+            print(f"Running OCR with {workers} worker processes")
+        ocr_results = ocr_pages(pages, workers=workers, cache=cache, known_lines=known_lines)
 
-    for page_num, image in enumerate(images):
-        print(f"Processing page {page_num + 1}/{len(images)}...")
+    for page_num, pixels, res in ocr_results:
+        print(f"Processing page {page_num + 1}/{page_count}...")
+        if page_num not in known_lines:
+            checkpoint.save_page(page_num, res)
+        height, width = pixels.shape[:2]
         
-        # 1. Draw Image FIRST (so text is on top)
-        temp_img_path = f"temp_page_{page_num}.jpg"
-        image.save(temp_img_path)
-        c.setPageSize((image.width, image.height))
-        c.drawImage(temp_img_path, 0, 0, width=image.width, height=image.height)
-        os.remove(temp_img_path)
-        
-        # OCR
-        result = ocr.ocr(np.array(image))
-        res = result[0]
-        
-        if res and 'rec_texts' in res:
-            texts = res['rec_texts']
-            scores = res['rec_scores']
-            boxes = res['rec_boxes'] # [xmin, ymin, xmax, ymax]
-            
-            # Add to HTML
-            html_content.append(f'<div class="page" id="page-{page_num+1}">')
-            
-            # Filter and collect text with HIGHER confidence threshold
-            for text, score, box in zip(texts, scores, boxes):
-                # Increased threshold from 0.6 to 0.75 to filter out noise
-                if score > 0.75:
-                    # --- Searchable PDF (Invisible Text) ---
-                    img_width, img_height = image.size
-                    
-                    x = box[0]
-                    y = img_height - box[3] 
-                    
-                    # Calculate font size
-                    box_height = box[3] - box[1]
-                    font_size = box_height * 0.75
-                    
-                    t = c.beginText()
-                    t.setTextRenderMode(3) # Invisible
-                    t.setFont('DejaVuSans', font_size)
-                    t.setTextOrigin(x, y)
-                    
-                    # Handle Arabic reshaping
-                    reshaped_text = arabic_reshaper.reshape(text)
-                    bidi_text = get_display(reshaped_text)
-                    
-                    t.textOut(bidi_text)
-                    c.drawText(t)
-                    
-                    # --- Determine Direction (RTL/LTR) ---
-                    is_arabic = any('\u0600' <= char <= '\u06FF' for char in text)
-                    direction = 'rtl' if is_arabic else 'ltr'
-                    align = WD_ALIGN_PARAGRAPH.RIGHT if is_arabic else WD_ALIGN_PARAGRAPH.LEFT
-                    
-                    # --- Word ---
-                    p = doc.add_paragraph(text)
-                    p.alignment = align
-                    
-                    # --- HTML ---
-                    html_content.append(f'<p class="{direction}">{text}</p>')
-            
-            html_content.append('</div><hr>')
-            c.showPage()
-            
-            # Add page break in Word
-            if page_num < len(images) - 1:
-                doc.add_page_break()
-            
-        else:
+        # Keep lines above the confidence threshold, with geometry computed for the whole page
+        result = build_page_result(page_num, width, height, res,
+                                   from_text_layer=page_num in text_layers)
+        if result is None:
             print(f"No text found on page {page_num + 1}")
-            c.showPage()
-
-    # Save Word
-    word_path = os.path.join(output_dir, f"{base_name}.docx")
-    doc.save(word_path)
-    print(f"\nSaved Word doc: {word_path}")
-    
-    # Save HTML with improved CSS
-    html_header = '''<html dir="rtl">
-<head>
-    <meta charset="utf-8">
-    <link rel="preconnect" href="https://fonts.googleapis.com">
-    <link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
-    <link href="https://fonts.googleapis.com/css2?family=Cairo:wght@400;700&family=Roboto+Mono:wght@400;700&display=swap" rel="stylesheet">
-    <style>
-        body { 
-            font-family: 'Cairo', 'Roboto Mono', monospace; 
-            line-height: 1.8; 
-            background-color: #f9f9f9;
-            color: #333;
-            max-width: 900px;
-            margin: 0 auto;
-            padding: 40px;
-        }
-        .page {
-            background: white;
-            padding: 40px;
-            margin-bottom: 20px;
-            box-shadow: 0 2px 5px rgba(0,0,0,0.1);
-            border-radius: 8px;
-        }
-        p { margin-bottom: 12px; }
-        .rtl { direction: rtl; text-align: right; }
-        .ltr { 
-            direction: ltr; 
-            text-align: left; 
-            font-family: 'Roboto Mono', monospace;
-            background-color: #f5f5f5;
-            padding: 8px;
-            border-radius: 4px;
-            border-left: 3px solid #4CAF50;
-        }
-        hr { border: 0; border-top: 1px solid #eee; margin: 40px 0; }
-    </style>
-</head>
-<body>'''
-    
-    final_html = html_header + "".join(html_content) + '</body></html>'
-    
-    html_path = os.path.join(output_dir, f"{base_name}.html")
-    with open(html_path, 'w', encoding='utf-8') as f:
-        f.write(final_html)
         
-    print(f"Saved HTML: {html_path}")
-    
-    # Save PDF
-    c.save()
-    print(f"Saved Searchable PDF: {pdf_output_path}")
+        image = Image.fromarray(pixels) if writers.needs_image else None
+        writers.submit(page_num, result, image)
+
+    errors = writers.close()
+    checkpoint.finish()
+
+    if cache:
+        print(f"\nOCR cache: {cache.hits} pages reused, {cache.misses} pages recognized")
+    hits, misses, _ = shaping_stats()
+    if hits + misses:
+        print(f"Arabic shaping: {hits}/{hits + misses} lines reused ({hits / (hits + misses):.0%})")
+
+    print()
+    for writer in writers.writers:
+        if writer in errors:
+            print(f"ERROR writing {writer.label}: {errors[writer]}")
+        else:
+            print(f"Saved {writer.label}: {writer.output_path}")
     print(f"\nImages extracted to: {images_dir}")
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print("Usage: python process_pdf.py <pdf_path> <output_dir>")
-    else:
-        process_pdf_to_formats(sys.argv[1], sys.argv[2])
+    parser = argparse.ArgumentParser(description="OCR a PDF into Word, HTML and searchable PDF")
+    parser.add_argument("pdf_path")
+    parser.add_argument("output_dir")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of OCR worker processes (default: 1, in-process)")
+    parser.add_argument("--batch-size", type=int, default=0,
+                        help="Recognize text lines from several pages in batches of this size (default: off)")
+    parser.add_argument("--pdf-mode", choices=['raster', 'overlay'], default='raster',
+                        help="raster: rebuild the searchable PDF from page images; "
+                             "overlay: add the text layer to the original PDF (smaller, faster)")
+    parser.add_argument("--cache-dir", default=str(DEFAULT_CACHE_DIR),
+                        help=f"Per-page OCR result cache (default: {DEFAULT_CACHE_DIR})")
+    parser.add_argument("--no-cache", action="store_true", help="Always run OCR, ignoring the cache")
+    parser.add_argument("--ocr-all", action="store_true",
+                        help="OCR every page, even pages with a usable embedded text layer")
+    parser.add_argument("--formats", default=",".join(OUTPUT_FORMATS),
+                        help=f"Comma-separated outputs to produce (default: {','.join(OUTPUT_FORMATS)})")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue an interrupted run from its page checkpoints")
+    args = parser.parse_args()
+    formats = [fmt.strip() for fmt in args.formats.split(",") if fmt.strip()]
+    unknown = sorted(set(formats) - set(OUTPUT_FORMATS))
+    if unknown:
+        parser.error(f"unknown output format(s): {', '.join(unknown)}")
+    if args.batch_size > 0 and args.workers > 1:
+        parser.error("--batch-size cannot be combined with --workers")
+    
+    process_pdf_to_formats(args.pdf_path, args.output_dir,
+                           workers=args.workers, batch_size=args.batch_size,
+                           pdf_mode=args.pdf_mode,
+                           cache_dir=None if args.no_cache else args.cache_dir,
+                           use_text_layer=not args.ocr_all,
+                           formats=formats,
+                           resume=args.resume)
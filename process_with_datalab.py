@@ -1,16 +1,98 @@
+import io
 import os
 import sys
+import json
+import base64
+import binascii
 import time
 import re
+import random
+import threading
+from email.utils import parsedate_to_datetime
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-import fitz  # PyMuPDF for image extraction
+import fitz  # PyMuPDF
 from dotenv import load_dotenv
+from text_layer import find_text_pages, page_markdown
+from checkpoint import RunCheckpoint, file_sha256
+from image_refs import IMAGE_PAGE_RE, rename_image_refs, link_page_images
+from response_cache import ConversionCache, DEFAULT_CACHE_DIR
+from pdf_slim import slim_pdf, format_report
 
 # Load environment variables from .env file
 load_dotenv()
 
-API_URL = "https://www.datalab.to/api/v1/marker"
+# DATALAB_API_URL points the clients elsewhere, e.g. at mock_datalab.py
+API_URL = os.getenv("DATALAB_API_URL", "https://www.datalab.to/api/v1/marker")
+
+# Status polling: short first waits for small jobs, then exponential backoff with jitter
+POLL_INITIAL_DELAY = 0.5
+POLL_MAX_DELAY = 20
+POLL_BACKOFF = 1.5
+POLL_TIMEOUT = 600  # 10 minutes
+REQUEST_TIMEOUT = 60
+# Status codes worth retrying: rate limited, or the service is struggling
+RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+# Submissions: (connect, read) timeouts; the first also bounds each stalled upload write
+SUBMIT_TIMEOUT = (REQUEST_TIMEOUT, 300)
+# API images are decoded this many base64 characters at a time
+BASE64_CHUNK_CHARS = 1024 * 1024
+# Chunked conversions: at most this many chunks are outstanding at once
+MAX_PARALLEL_CHUNKS = 4
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """Shared keep-alive session, so status checks reuse pooled connections"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+def poll_delay(attempt):
+    """Seconds to wait before status check number `attempt` (0-based), with jitter"""
+    delay = min(POLL_MAX_DELAY, POLL_INITIAL_DELAY * POLL_BACKOFF ** attempt)
+    # Jitter keeps many jobs from polling in lockstep
+    return delay * random.uniform(0.75, 1.25)
+
+def retry_after_seconds(headers):
+    """Parse a Retry-After header (seconds or HTTP date); None if absent or invalid"""
+    value = headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+# Pagination marker written before each page when paginate=True: {page_index}----...
+PAGE_SEPARATOR = "-" * 48
+PAGE_MARKER_RE = re.compile(r'\n*\{(\d+)\}-{3,}\n*')
+# Image references in HTML src="name"
+IMAGE_SRC_RE = re.compile(r'(src=")([^"]+)(")')
+
+def rename_html_images(html, renames):
+    """Point src="name" attributes whose name is a key of `renames` at the new name"""
+    if not renames:
+        return html
+
+    def resolve(match):
+        return f"{match.group(1)}{renames.get(match.group(2), match.group(2))}{match.group(3)}"
+
+    return IMAGE_SRC_RE.sub(resolve, html)
 
 def fix_image_paths_in_markdown(markdown_content, images_dir, base_name):
     """
@@ -20,101 +102,287 @@ def fix_image_paths_in_markdown(markdown_content, images_dir, base_name):
     images_dir = Path(images_dir)
     if not images_dir.exists():
         return markdown_content
-    
-    # Get list of extracted images
-    image_files = sorted(images_dir.glob("*"))
-    if not image_files:
-        return markdown_content
-    
-    # Create mapping of page numbers to images
-    page_to_image = {}
-    for img_file in image_files:
-        # Extract page number from filename (e.g., page16_img1.jpeg -> 16)
-        match = re.search(r'page(\d+)_', img_file.name)
-        if match:
-            page_num = int(match.group(1))
-            if page_num not in page_to_image:
-                page_to_image[page_num] = []
-            page_to_image[page_num].append(img_file)
-    
-    # Function to replace image references
-    def replace_image(match):
-        description = match.group(1) if match.group(1) else "Image"
-        old_path = match.group(2)
-        
-        # Try to extract page number from old path
-        page_match = re.search(r'_page_(\d+)_', old_path)
-        if page_match:
-            # Page numbers in filename are 0-indexed, but we want 1-indexed
-            page_num = int(page_match.group(1)) + 1
-            
-            if page_num in page_to_image:
-                img_file = page_to_image[page_num][0]
-                rel_path = f"{images_dir.name}/{img_file.name}"
-                return f"![{description}]({rel_path})"
+    markdown_content, _ = link_page_images(markdown_content, images_dir)
+    return markdown_content
+
+def format_page_range(pages):
+    """Format 0-indexed page numbers as a Datalab page_range string, e.g. [0, 1, 2, 5] -> '0-2,5'"""
+    ranges = []
+    for page in sorted(pages):
+        if ranges and page == ranges[-1][1] + 1:
+            ranges[-1][1] = page
+        else:
+            ranges.append([page, page])
+    return ','.join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
+
+def split_paginated_markdown(markdown_content):
+    """
+    Split paginated markdown into (preamble, [(page_index, content), ...])
+    using the {N}---- markers that separate pages.
+    """
+    parts = PAGE_MARKER_RE.split(markdown_content)
+    pages = [(int(parts[i]), parts[i + 1]) for i in range(1, len(parts), 2)]
+    return parts[0], pages
+
+def join_paginated_markdown(pages, preamble=""):
+    """Join (page_index, content) pairs back into paginated markdown"""
+    chunks = [preamble.strip()] if preamble.strip() else []
+    for page_index, content in pages:
+        chunks.append(f"{{{page_index}}}{PAGE_SEPARATOR}\n\n{content.strip()}")
+    return "\n\n".join(chunks) + "\n"
+
+def merge_text_layer_pages(markdown_content, ocr_pages, text_pages_md):
+    """
+    Combine the API's markdown for the OCR'd pages with locally extracted
+    markdown for text-layer pages, in page order.
+
+    Args:
+        markdown_content: Paginated markdown returned for `ocr_pages`
+        ocr_pages: Sorted 0-indexed pages that were sent for OCR
+        text_pages_md: {page_index: markdown} for the pages that were not
+    """
+    preamble, api_pages = split_paginated_markdown(markdown_content)
+    # Markers normally carry the original page numbers; fall back to request order
+    if not {page for page, _ in api_pages} <= set(ocr_pages):
+        api_pages = list(zip(ocr_pages, (content for _, content in api_pages)))
+
+    merged = dict(api_pages)
+    merged.update(text_pages_md)
+    return join_paginated_markdown(sorted(merged.items()), preamble)
+
+def chunk_pages(pages, size):
+    """Split page numbers into consecutive groups of at most `size` pages"""
+    return [pages[i:i + size] for i in range(0, len(pages), size)]
+
+def extract_pages_pdf(pdf_path, pages):
+    """Return the bytes of a new PDF holding only the given 0-indexed pages"""
+    with fitz.open(pdf_path) as doc:
+        doc.select(pages)
+        return doc.tobytes(garbage=3, deflate=True)
+
+def _renumber_image(filename, pages, chunk_index):
+    """Rename a chunk's image so its page number refers to the original PDF"""
+    match = IMAGE_PAGE_RE.search(filename)
+    if match and int(match.group(1)) < len(pages):
+        return f"{filename[:match.start(1)]}{pages[int(match.group(1))]}{filename[match.end(1):]}"
+    # No page number to fix: keep names from different chunks apart
+    return f"chunk{chunk_index + 1}_{filename}"
+
+def merge_chunk_results(chunks):
+    """
+    Merge the results of a PDF converted in chunks into one result, as if
+    the pages had been converted together.
+
+    Each chunk's pagination markers and image file names count pages from 0
+    within the chunk; they are renumbered to the original PDF's pages.
+
+    Args:
+        chunks: [(pages, result), ...] in page order, where pages are the
+            0-indexed original pages sent in that chunk
+    """
+    preamble = ""
+    merged_pages = []
+    images = {}
+    html_parts = []
+    for chunk_index, (pages, result) in enumerate(chunks):
+        renames = {filename: _renumber_image(filename, pages, chunk_index)
+                   for filename in (result.get('images') or {})}
+        for filename, data in (result.get('images') or {}).items():
+            images[renames[filename]] = data
+
+        markdown = rename_image_refs(result.get('markdown', ''), renames)
+        chunk_preamble, chunk_md_pages = split_paginated_markdown(markdown)
+        if chunk_index == 0:
+            preamble = chunk_preamble
+        # Markers count from 0 within the chunk; fall back to order if they do not
+        if all(local < len(pages) for local, _ in chunk_md_pages):
+            merged_pages.extend((pages[local], content) for local, content in chunk_md_pages)
+        else:
+            merged_pages.extend(zip(pages, (content for _, content in chunk_md_pages)))
+
+        if result.get('html'):
+            html_parts.append(rename_html_images(result['html'], renames))
+
+    return {
+        'status': 'complete',
+        'success': True,
+        'markdown': join_paginated_markdown(merged_pages, preamble),
+        'images': images,
+        'html': "\n".join(html_parts) or None,
+        'page_count': sum(len(pages) for pages, _ in chunks),
+        'chunks': [{'pages': pages, 'metadata': result.get('metadata')} for pages, result in chunks],
+    }
+
+def conversion_options(use_llm=False, page_range=None):
+    """Form fields sent with every conversion request (besides the file)"""
+    options = {
+        "force_ocr": True,  # Force OCR since original text is bad
+        "paginate": True,
+        'output_format': 'markdown',
+        "use_llm": use_llm,
+        "strip_existing_ocr": True,  # Remove bad existing OCR
+        "disable_image_extraction": False
+    }
+    if page_range:
+        options["page_range"] = page_range
+    return options
+
+def split_text_layer_pages(pdf_path):
+    """
+    Find the pages whose own text is usable and do not need OCR.
+    Returns (text_pages_md, ocr_pages): {page_index: markdown} for the
+    text-layer pages and the sorted 0-indexed pages left for OCR.
+    """
+    with fitz.open(pdf_path) as doc:
+        page_count = len(doc)
+        text_pages_md = {page: page_markdown(doc[page]) for page in find_text_pages(str(pdf_path))}
+    ocr_pages = [page for page in range(page_count) if page not in text_pages_md]
+    return text_pages_md, ocr_pages
+
+def submit_conversion(pdf_path, headers, use_llm=False, page_range=None, pdf_bytes=None):
+    """
+    Submit a PDF to the API. Returns the submit response (request_id,
+    request_check_url), or None on error. If pdf_bytes is given, those bytes
+    are uploaded under pdf_path's name instead of the file itself.
+    """
+    pdf_path = Path(pdf_path)
+    if page_range:
+        print(f"OCR pages: {page_range}")
+    with (io.BytesIO(pdf_bytes) if pdf_bytes is not None else open(pdf_path, 'rb')) as f:
+        form_data = {'file': (pdf_path.name, f, 'application/pdf')}
+        form_data.update({name: (None, value)
+                          for name, value in conversion_options(use_llm, page_range).items()})
         
-        # If no match, try to find by context (look for {XX}---- pattern)
-        return match.group(0)
-    
-    # Replace image references
-    # Pattern: ![description](_page_XX_Figure_Y.jpeg) or ![description]()
-    markdown_content = re.sub(
-        r'!\[([^\]]*)\]\(([^\)]*_page_\d+[^\)]*)\)',
-        replace_image,
-        markdown_content
-    )
+        try:
+            start = time.perf_counter()
+            response = get_session().post(API_URL, files=form_data, headers=headers, timeout=SUBMIT_TIMEOUT)
+            print(f"Uploaded {pdf_path.name} ({f.tell() / 1e6:.2f} MB) in {time.perf_counter() - start:.1f}s")
+            response.raise_for_status()
+            data = response.json()
+        except requests.exceptions.RequestException as e:
+            print(f"ERROR submitting PDF: {e}")
+            if hasattr(e, 'response') and e.response is not None:
+                print(f"Response: {e.response.text}")
+            return None
     
-    # Also handle empty image references ![]()
-    # Find them by looking at surrounding context for page markers
-    lines = markdown_content.split('\n')
-    current_page = None
-    fixed_lines = []
+    if not data.get('success'):
+        print(f"ERROR: {data.get('error', 'Unknown error')}")
+        return None
+    return data
+
+def poll_conversion(check_url, headers, timeout=POLL_TIMEOUT, label=""):
+    """Poll a submitted conversion. Returns the final result ('complete' or 'failed'), or None on timeout"""
+    session = get_session()
+    deadline = time.monotonic() + timeout
+    delay = poll_delay(0)
+    attempt = 0
     
-    for line in lines:
-        # Check for page marker {XX}----
-        page_marker = re.search(r'\{(\d+)\}---', line)
-        if page_marker:
-            current_page = int(page_marker.group(1)) + 1  # Convert to 1-indexed
+    while time.monotonic() + delay < deadline:
+        time.sleep(delay)
+        attempt += 1
+        delay = poll_delay(attempt)
         
-        # Replace empty image references with actual images
-        if '![]()' in line and current_page and current_page in page_to_image:
-            img_file = page_to_image[current_page][0]
-            rel_path = f"{images_dir.name}/{img_file.name}"
-            line = line.replace('![]()', f'![Image from page {current_page}]({rel_path})')
+        try:
+            response = session.get(check_url, headers=headers, timeout=REQUEST_TIMEOUT)
+            # Rate limited or busy: wait as long as the server asks
+            retry_after = retry_after_seconds(response.headers)
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            response.raise_for_status()
+            check_result = response.json()
+        except requests.exceptions.RequestException as e:
+            print(f"{label}ERROR checking status: {e}")
+            continue
         
-        fixed_lines.append(line)
+        status = check_result.get('status')
+        if status in ('complete', 'failed'):
+            return check_result
+        print(f"  {label}Status: {status} (poll {attempt}, next in {delay:.1f}s)")
     
-    return '\n'.join(fixed_lines)
+    return None
+
+def write_base64_file(b64_data, path, chunk_chars=BASE64_CHUNK_CHARS):
+    """Decode base64 (optionally a data: URI) to a file, a slice at a time"""
+    # Skip a data URI prefix if present (e.g. data:image/png;base64,...)
+    start = b64_data.find(',') + 1
+    carry = ''
+    with open(path, 'wb') as f:
+        for offset in range(start, len(b64_data), chunk_chars):
+            piece = b64_data[offset:offset + chunk_chars]
+            if not carry:
+                try:
+                    f.write(base64.b64decode(piece, validate=True))
+                    continue
+                except binascii.Error:
+                    pass
+            # Line-wrapped base64: drop the whitespace, decode whole
+            # 4-character groups and carry the rest to the next slice
+            piece = carry + ''.join(piece.split())
+            usable = len(piece) - len(piece) % 4
+            f.write(base64.b64decode(piece[:usable]))
+            carry = piece[usable:]
+        if carry:
+            f.write(base64.b64decode(carry))
 
-def extract_images_from_pdf(pdf_path, output_dir):
-    """Extract all images from PDF using PyMuPDF"""
-    os.makedirs(output_dir, exist_ok=True)
-    doc = fitz.open(pdf_path)
-    image_count = 0
+def save_conversion(check_result, output_dir, base_name, ocr_pages=None, text_pages_md=None):
+    """
+    Write the markdown, images, HTML and metadata of a completed conversion.
+    Images are decoded straight to files and dropped from check_result as
+    they are written; the metadata file refers to the written files instead
+    of repeating their contents.
+    """
+    output_dir = Path(output_dir)
+    markdown_path = output_dir / f"{base_name}.md"
+    html_path = output_dir / f"{base_name}.html"
+    images_dir = output_dir / f"{base_name}_images"
     
-    for page_num in range(len(doc)):
-        page = doc[page_num]
-        image_list = page.get_images()
-        
-        for img_index, img in enumerate(image_list):
-            xref = img[0]
-            base_image = doc.extract_image(xref)
-            image_bytes = base_image["image"]
-            image_ext = base_image["ext"]
-            
-            image_filename = f"page{page_num+1}_img{img_index+1}.{image_ext}"
-            image_path = os.path.join(output_dir, image_filename)
-            
-            with open(image_path, "wb") as img_file:
-                img_file.write(image_bytes)
-            
-            image_count += 1
-            print(f"  Extracted: {image_filename}")
+    # Save images from API
+    images = check_result.pop('images', None) or {}
+    image_files = {}
+    if images:
+        images_dir.mkdir(exist_ok=True)
+        # Popping releases each base64 payload once it is on disk
+        for filename in list(images):
+            b64_data = images.pop(filename)
+            try:
+                write_base64_file(b64_data, images_dir / filename)
+                image_files[filename] = f"{images_dir.name}/{filename}"
+                print(f"  Saved API image: {filename}")
+            except Exception as e:
+                print(f"  Error saving image {filename}: {e}")
+        print(f"Saved {len(image_files)} images from API to {images_dir}")
+    
+    # Save markdown (once, with image paths already fixed)
+    markdown_content = check_result.pop('markdown', '')
+    if text_pages_md:
+        markdown_content = merge_text_layer_pages(markdown_content, ocr_pages, text_pages_md)
+        check_result['text_layer_pages'] = sorted(text_pages_md)
+    markdown_content = rename_image_refs(markdown_content, image_files)
+    with open(markdown_path, 'w', encoding='utf-8') as f:
+        f.write(markdown_content)
+    del markdown_content
+    check_result['markdown'] = markdown_path.name
+    print(f"Saved Markdown: {markdown_path}")
     
-    print(f"Total images extracted: {image_count}")
-    return image_count
+    # Save HTML (if available)
+    html_content = check_result.pop('html', None)
+    if html_content:
+        # The API refers to images by bare file name; point references into images_dir
+        html_content = rename_html_images(html_content, image_files)
+        with open(html_path, 'w', encoding='utf-8') as f:
+            f.write(html_content)
+        check_result['html'] = html_path.name
+        print(f"Saved HTML: {html_path}")
+    
+    # Save JSON metadata, with file references in place of the contents
+    check_result['images'] = image_files
+    json_path = output_dir / f"{base_name}_metadata.json"
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(check_result, f, indent=2, ensure_ascii=False)
+    print(f"Saved Metadata: {json_path}")
 
-def process_pdf_with_datalab(pdf_path, output_dir, api_key=None, use_llm=False):
+def process_pdf_with_datalab(pdf_path, output_dir, api_key=None, use_llm=False, use_text_layer=True,
+                             resume=False, cache_dir=DEFAULT_CACHE_DIR, chunk_size=0, slim=False):
     """
     Process PDF using Datalab's Chandra API
     
@@ -123,7 +391,57 @@ def process_pdf_with_datalab(pdf_path, output_dir, api_key=None, use_llm=False):
         output_dir: Directory to save outputs
         api_key: Datalab API key (or set DATALAB_API_KEY env variable)
         use_llm: Use LLM for better accuracy (slower, costs more)
+        use_text_layer: Take pages with a trustworthy embedded text layer from
+            the PDF itself and only send the remaining pages to the API
+        resume: Continue an interrupted run: re-poll a job that was already
+            submitted, or rebuild the outputs from a result already received,
+            instead of submitting the PDF again
+        cache_dir: Where finished conversions are cached, keyed by the PDF's
+            SHA-256 and the conversion options (None disables the cache)
+        chunk_size: If > 0, split the pages to convert into sub-PDFs of this
+            many pages and convert them in parallel; the results are merged
+            with page markers and image names renumbered to the original PDF
+        slim: Shrink each upload first (downsample oversized scans, drop old
+            OCR text layers, rewrite compactly) and report the bytes saved
     """
+    pdf_path = Path(pdf_path)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    
+    base_name = pdf_path.stem
+    
+    # Pages whose own text is usable do not need OCR
+    text_pages_md = {}
+    ocr_pages = None
+    if use_text_layer:
+        text_pages_md, ocr_pages = split_text_layer_pages(pdf_path)
+        page_count = len(text_pages_md) + len(ocr_pages)
+        print(f"\n=== Text layer: {len(text_pages_md)}/{page_count} pages usable without OCR ===")
+        
+        if not ocr_pages:
+            markdown_path = output_dir / f"{base_name}.md"
+            with open(markdown_path, 'w', encoding='utf-8') as f:
+                f.write(join_paginated_markdown(sorted(text_pages_md.items())))
+            print(f"Saved Markdown: {markdown_path} (no API call needed)")
+            return
+    page_range = format_page_range(ocr_pages) if text_pages_md else None
+    pdf_sha256 = file_sha256(pdf_path)
+    
+    # The same PDF converted with the same options before: no API call
+    cache = ConversionCache(cache_dir) if cache_dir else None
+    if cache:
+        options = conversion_options(use_llm, page_range)
+        if chunk_size > 0:
+            options['chunk_size'] = chunk_size
+        if slim:
+            options['slim'] = True
+        cache_key = cache.key(pdf_sha256, API_URL, options)
+        check_result = cache.get(cache_key)
+        if check_result is not None:
+            print("\n=== Using cached conversion ===")
+            save_conversion(check_result, output_dir, base_name, ocr_pages, text_pages_md)
+            return
+    
     # Get API key
     if api_key is None:
         api_key = os.getenv("DATALAB_API_KEY")
@@ -134,155 +452,121 @@ def process_pdf_with_datalab(pdf_path, output_dir, api_key=None, use_llm=False):
         print("Get your API key from: https://www.datalab.to/")
         return
     
-    pdf_path = Path(pdf_path)
-    output_dir = Path(output_dir)
-    output_dir.mkdir(parents=True, exist_ok=True)
-    
-    base_name = pdf_path.stem
-    
-    # Extract images first
-    print(f"\n=== Extracting images from PDF ===")
-    images_dir = output_dir / f"{base_name}_images"
-    # extract_images_from_pdf(str(pdf_path), str(images_dir))
+    # One checkpoint per API job, reused only for the same PDF and options
+    checkpoint = RunCheckpoint(output_dir / f"{base_name}_run")
+    settings = {
+        'pdf_sha256': pdf_sha256,
+        'use_llm': use_llm,
+        'page_range': page_range,
+        'chunk_size': chunk_size,
+        'slim': slim,
+    }
+    resumed = checkpoint.open(settings, resume=resume)
+    headers = {"X-Api-Key": api_key}
     
-    print(f"\n=== Submitting PDF to Datalab API ===")
+    # Chunked: one sub-PDF per group of pages, converted in parallel
+    if chunk_size > 0:
+        if ocr_pages is None:
+            with fitz.open(pdf_path) as doc:
+                ocr_pages = list(range(len(doc)))
+        jobs = [(f"{pages[0]}-{pages[-1]}", pages) for pages in chunk_pages(ocr_pages, chunk_size)]
+        print(f"\n=== Submitting {len(jobs)} chunks of up to {chunk_size} pages to Datalab API ===")
+    else:
+        jobs = [("all", None)]
+        print(f"\n=== Submitting PDF to Datalab API ===")
     print(f"File: {pdf_path.name}")
     print(f"Using LLM: {use_llm}")
     
-    # Submit PDF
-    with open(pdf_path, 'rb') as f:
-        form_data = {
-            'file': (pdf_path.name, f, 'application/pdf'),
-            "force_ocr": (None, True),  # Force OCR since original text is bad
-            "paginate": (None, True),
-            'output_format': (None, 'markdown'),
-            "use_llm": (None, use_llm),
-            "strip_existing_ocr": (None, True),  # Remove bad existing OCR
-            "disable_image_extraction": (None, False)
-        }
-        headers = {"X-Api-Key": api_key}
+    # PyMuPDF is not thread-safe: build (and slim) every upload here, one
+    # after another, so the pool below only does HTTP
+    states = {chunk_id: checkpoint.load_chunk(chunk_id) if resumed else None for chunk_id, _ in jobs}
+    uploads = {}
+    for chunk_id, pages in jobs:
+        if states[chunk_id] and states[chunk_id]['status'] in ('submitted', 'complete'):
+            continue
+        pdf_bytes = extract_pages_pdf(pdf_path, pages) if pages is not None else None
+        if slim:
+            pdf_bytes, report = slim_pdf(pdf_bytes if pdf_bytes is not None else pdf_path)
+            label = f"[pages {chunk_id}] " if pages is not None else ""
+            print(f"{label}{format_report(report)}")
+        uploads[chunk_id] = pdf_bytes
+    
+    def run_job(chunk_id, pages):
+        label = f"[pages {chunk_id}] " if pages is not None else ""
+        state = states[chunk_id]
+        if state and state['status'] == 'complete':
+            print(f"{label}Resuming: conversion already received")
+            return state['result']
         
-        try:
-            response = requests.post(API_URL, files=form_data, headers=headers)
-            response.raise_for_status()
-            data = response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"ERROR submitting PDF: {e}")
-            if hasattr(e, 'response') and e.response is not None:
-                print(f"Response: {e.response.text}")
-            return
+        if state and state['status'] == 'submitted':
+            print(f"{label}Resuming: request {state['request_id']} already submitted")
+        else:
+            data = submit_conversion(pdf_path, headers, use_llm=use_llm,
+                                     page_range=page_range if pages is None else None,
+                                     pdf_bytes=uploads.pop(chunk_id))
+            if data is None:
+                return None
+            state = {
+                'status': 'submitted',
+                'request_id': data['request_id'],
+                'check_url': data['request_check_url'],
+            }
+            checkpoint.save_chunk(chunk_id, state)
+        
+        print(f"{label}Request ID: {state['request_id']}, polling for completion...")
+        check_result = poll_conversion(state['check_url'], headers, label=label)
+        if check_result is None:
+            print(f"{label}⏱️ Timeout waiting for conversion (rerun with --resume to keep polling)")
+            return None
+        if check_result.get('status') == 'failed':
+            print(f"{label}❌ Conversion failed: {check_result.get('error', 'Unknown error')}")
+            return None
+        checkpoint.save_chunk(chunk_id, dict(state, status='complete', result=check_result))
+        return check_result
     
-    if not data.get('success'):
-        print(f"ERROR: {data.get('error', 'Unknown error')}")
+    with ThreadPoolExecutor(max_workers=min(len(jobs), MAX_PARALLEL_CHUNKS)) as pool:
+        results = list(pool.map(lambda job: run_job(*job), jobs))
+    if any(result is None for result in results):
+        print(f"❌ {sum(result is None for result in results)}/{len(jobs)} jobs did not finish")
         return
     
-    request_id = data['request_id']
-    check_url = data['request_check_url']
-    print(f"Request ID: {request_id}")
-    print(f"Polling for completion...")
-    
-    # Poll for completion
-    max_polls = 300  # 10 minutes max
-    for i in range(max_polls):
-        time.sleep(2)
-        
-        try:
-            response = requests.get(check_url, headers=headers)
-            response.raise_for_status()
-            check_result = response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"ERROR checking status: {e}")
-            continue
-        
-        status = check_result.get('status')
-        
-        if status == 'complete':
-            print(f"\n✅ Conversion complete!")
-            
-            # Save markdown
-            markdown_content = check_result.get('markdown', '')
-            markdown_path = output_dir / f"{base_name}.md"
-            with open(markdown_path, 'w', encoding='utf-8') as f:
-                f.write(markdown_content)
-            print(f"Saved Markdown: {markdown_path}")
-            
-            # Save images from API
-            images = check_result.get('images', {})
-            if images:
-                images_dir = output_dir / f"{base_name}_images"
-                images_dir.mkdir(exist_ok=True)
-                
-                import base64
-                count = 0
-                for filename, b64_data in images.items():
-                    image_path = images_dir / filename
-                    try:
-                        # Handle data URI scheme if present (e.g. data:image/png;base64,...)
-                        if ',' in b64_data:
-                            b64_data = b64_data.split(',')[1]
-                        
-                        with open(image_path, 'wb') as f:
-                            f.write(base64.b64decode(b64_data))
-                        count += 1
-                        print(f"  Saved API image: {filename}")
-                    except Exception as e:
-                        print(f"  Error saving image {filename}: {e}")
-                
-                print(f"Saved {count} images from API to {images_dir}")
-                
-                # Update markdown to point to these images
-                # The API usually returns paths like "image.png", we need "images_dir/image.png"
-                # But wait, if we put markdown in output_dir and images in output_dir/images_dir
-                # We need to update references
-                
-                # Simple replace for now: look for the filenames and prepend the dir
-                for filename in images.keys():
-                    markdown_content = markdown_content.replace(f"({filename})", f"({images_dir.name}/{filename})")
-                
-                with open(markdown_path, 'w', encoding='utf-8') as f:
-                    f.write(markdown_content)
-                print("Updated markdown image paths")
-
-            # Skip local path fixing since we're using API images now
-            # markdown_content = fix_image_paths_in_markdown(...)
-            
-            # Save HTML (if available)
-            html_content = check_result.get('html')
-            if html_content:
-                html_path = output_dir / f"{base_name}.html"
-                with open(html_path, 'w', encoding='utf-8') as f:
-                    f.write(html_content)
-                print(f"Saved HTML: {html_path}")
-            
-            # Save JSON metadata
-            import json
-            json_path = output_dir / f"{base_name}_metadata.json"
-            with open(json_path, 'w', encoding='utf-8') as f:
-                json.dump(check_result, f, indent=2, ensure_ascii=False)
-            print(f"Saved Metadata: {json_path}")
-            
-            return
-            
-        elif status == 'failed':
-            print(f"❌ Conversion failed: {check_result.get('error', 'Unknown error')}")
-            return
-        else:
-            print(f"  Status: {status} (poll {i+1}/{max_polls})")
+    if chunk_size > 0:
+        check_result = merge_chunk_results([(pages, result) for (_, pages), result in zip(jobs, results)])
+    else:
+        check_result = results[0]
+    print(f"\n✅ Conversion complete!")
     
-    print("⏱️ Timeout waiting for conversion")
+    if cache:
+        cache.put(cache_key, check_result)
+    save_conversion(check_result, output_dir, base_name, ocr_pages, text_pages_md)
+    checkpoint.finish()
 
 if __name__ == "__main__":
     if len(sys.argv) < 3:
-        print("Usage: python process_with_datalab.py <pdf_path> <output_dir> [--use-llm]")
+        print("Usage: python process_with_datalab.py <pdf_path> <output_dir> [--use-llm] [--ocr-all] [--resume] [--no-cache] [--chunk-pages N] [--slim]")
         print("\nEnvironment variables:")
         print("  DATALAB_API_KEY: Your Datalab API key (required)")
         print("\nOptions:")
         print("  --use-llm: Use LLM for better accuracy (slower, costs more)")
+        print("  --ocr-all: Send every page to OCR, even pages with a usable text layer")
+        print("  --resume: Continue an interrupted run instead of submitting the PDF again")
+        print("  --no-cache: Always call the API, ignoring cached conversions")
+        print("  --chunk-pages N: Convert long PDFs as parallel chunks of N pages")
+        print("  --slim: Shrink the PDF before uploading (downsample big scans, drop old OCR text)")
         print("\nGet your API key from: https://www.datalab.to/")
         sys.exit(1)
     
     pdf_path = sys.argv[1]
     output_dir = sys.argv[2]
     use_llm = '--use-llm' in sys.argv
+    use_text_layer = '--ocr-all' not in sys.argv
+    resume = '--resume' in sys.argv
+    cache_dir = None if '--no-cache' in sys.argv else DEFAULT_CACHE_DIR
+    chunk_size = 0
+    if '--chunk-pages' in sys.argv:
+        chunk_size = int(sys.argv[sys.argv.index('--chunk-pages') + 1])
+    
+    slim = '--slim' in sys.argv
     
-    process_pdf_with_datalab(pdf_path, output_dir, use_llm=use_llm)
+    process_pdf_with_datalab(pdf_path, output_dir, use_llm=use_llm, use_text_layer=use_text_layer,
+                             resume=resume, cache_dir=cache_dir, chunk_size=chunk_size, slim=slim)
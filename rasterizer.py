@@ -0,0 +1,59 @@
+"""
+Render PDF pages in-process with PyMuPDF straight into NumPy arrays.
+Replaces the pdf2image/pdftoppm round trip (subprocess, PPM files, PIL decode,
+np.array copy) used by the OCR scripts.
+"""
+import numpy as np
+import fitz  # PyMuPDF
+
+COLORSPACES = {
+    'rgb': fitz.csRGB,
+    'gray': fitz.csGRAY,
+}
+
+def get_page_count(pdf_path):
+    """Return the number of pages in a PDF without rendering anything"""
+    with fitz.open(pdf_path) as doc:
+        return len(doc)
+
+def pixmap_to_array(pix):
+    """
+    Return a uint8 array viewing the pixmap's sample buffer (no copy).
+    Shape is (height, width) for gray and (height, width, channels) otherwise.
+    The view is only valid while `pix` is alive.
+    """
+    if pix.n == 1:
+        shape, strides = (pix.height, pix.width), (pix.stride, 1)
+    else:
+        shape, strides = (pix.height, pix.width, pix.n), (pix.stride, pix.n, 1)
+    return np.ndarray(shape, dtype=np.uint8, buffer=pix.samples_mv, strides=strides)
+
+def render_pages(pdf_path, dpi=200, colorspace='rgb', first_page=None, last_page=None):
+    """
+    Yield (page_index, array) for each page, rendering one page at a time.
+
+    Args:
+        pdf_path: Path to PDF file
+        dpi: Render resolution
+        colorspace: 'rgb' or 'gray'
+        first_page: First page to render (1-indexed, inclusive, default first)
+        last_page: Last page to render (1-indexed, inclusive, default last)
+
+    Each array is a view over the page's pixmap and is only valid until the
+    next page is requested; call .copy() on it to keep it longer.
+    """
+    if colorspace not in COLORSPACES:
+        raise ValueError(f"Unknown colorspace '{colorspace}', expected one of {list(COLORSPACES)}")
+
+    doc = fitz.open(pdf_path)
+    try:
+        start = max(first_page or 1, 1) - 1
+        stop = min(last_page or len(doc), len(doc))
+        matrix = fitz.Matrix(dpi / 72, dpi / 72)
+
+        for page_index in range(start, stop):
+            pix = doc[page_index].get_pixmap(matrix=matrix, colorspace=COLORSPACES[colorspace], alpha=False)
+            yield page_index, pixmap_to_array(pix)
+            del pix
+    finally:
+        doc.close()
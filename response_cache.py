@@ -0,0 +1,46 @@
+"""
+Persistent cache of finished Datalab conversions.
+Entries are keyed by the SHA-256 of the PDF plus the API endpoint and the
+conversion options, and hold the complete result (markdown, images, HTML
+and metadata), so converting the same file again needs no API call. Old
+entries are evicted least-recently-used first once the cache grows past
+its size cap.
+"""
+import os
+import json
+import hashlib
+from pathlib import Path
+from disk_cache import DiskCache
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "ocr-chandra" / "datalab"
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024  # 2 GB
+
+class ConversionCache(DiskCache):
+    """On-disk cache of API results with a size cap and LRU eviction"""
+
+    suffix = ".json"
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        super().__init__(cache_dir, max_bytes)
+
+    def key(self, pdf_sha256, api_url, options):
+        """Return the cache key for a PDF converted at `api_url` with the given form options"""
+        description = json.dumps({'pdf': pdf_sha256, 'api': api_url, 'options': options}, sort_keys=True)
+        return hashlib.sha256(description.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return the cached result for a key, or None"""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        # Mark as recently used for LRU eviction
+        os.utime(path)
+        return result
+
+    def put(self, key, result):
+        """Store a completed result (the API's final status response)"""
+        self._store(key, lambda f: json.dump(result, f, ensure_ascii=False), encoding='utf-8')
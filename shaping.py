@@ -0,0 +1,31 @@
+"""
+Arabic shaping and bidi reordering for drawing text into PDFs.
+arabic_reshaper and python-bidi are pure Python and slow, while running
+headers, footers and recurring phrases repeat on every page, so shaped lines
+are memoized in a bounded LRU cache shared by all writers (and threads).
+"""
+from functools import lru_cache
+import arabic_reshaper
+from bidi.algorithm import get_display
+
+SHAPING_CACHE_SIZE = 8192
+
+@lru_cache(maxsize=SHAPING_CACHE_SIZE)
+def _shape(text):
+    return get_display(arabic_reshaper.reshape(text))
+
+def visual_text(text):
+    """Return a line in visual order with Arabic letters in their joined forms"""
+    # Plain ASCII has nothing to shape or reorder
+    if text.isascii():
+        return text
+    return _shape(text)
+
+def visual_lines(texts):
+    """Shape all lines of a page in one call; returns a list in the same order"""
+    return [visual_text(text) for text in texts]
+
+def shaping_stats():
+    """Return (hits, misses, cached lines) of the shaping cache"""
+    info = _shape.cache_info()
+    return info.hits, info.misses, info.currsize
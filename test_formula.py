@@ -1,33 +1,21 @@
 import os
 import sys
-import numpy as np
-from pdf2image import convert_from_path
-# Try importing FormulaRecognition logic
-# It seems it might be part of PPStructure or separate.
-# Let's try to instantiate it directly if possible, or use PPStructure.
-from paddleocr import PPStructureV3
-
-# Initialize PPStructure which usually handles layout analysis including formulas
-# layout=True enables layout analysis
-# table=False, ocr=True
+from rasterizer import get_page_count, render_pages
+# PPStructureV3 usually handles layout analysis including formulas.
 # We want to see if it detects equations.
-engine = PPStructureV3()
+# It is loaded lazily through the model registry on first use.
+from models import get_model
 
 def test_formula(pdf_path):
     print(f"Testing formula recognition on {pdf_path}...")
-    images = convert_from_path(pdf_path)
+    page_count = get_page_count(pdf_path)
     
-    if images:
-        # Test on page 10 (where equations were visible in screenshots)
-        # Page 10 in 0-index is 9.
-        if len(images) > 9:
-            image = np.array(images[9])
-            print("Processing page 10...")
-        else:
-            image = np.array(images[0])
-            print("Processing page 1...")
+    # Test on page 10 (where equations were visible in screenshots)
+    page_no = 10 if page_count > 9 else 1
+    for _, image in render_pages(pdf_path, first_page=page_no, last_page=page_no):
+        print(f"Processing page {page_no}...")
             
-        result = engine(image)
+        result = get_model('structure')(image)
         
         for line in result:
             # line is a dict with keys like 'type', 'bbox', 'img', 'res'
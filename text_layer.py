@@ -0,0 +1,143 @@
+"""
+Detect pages whose embedded text layer can be used instead of OCR.
+A page qualifies when it carries enough visible text, most of its letters are
+Arabic, and it shows no signs of a broken encoding (replacement characters,
+private-use glyphs, Windows-1256 read as Latin-1, ...). Fonts with a wrong
+glyph-to-Unicode mapping still yield Arabic letters, but they come out as
+nonsense words split into single letters; those pages are caught by the
+share of one-letter words and of common Arabic function words. Invisible text
+is treated as an earlier OCR pass and does not count.
+"""
+import re
+import unicodedata
+import numpy as np
+import fitz  # PyMuPDF
+
+MIN_TEXT_CHARS = 20
+MIN_ARABIC_RATIO = 0.5
+MAX_BROKEN_RATIO = 0.01
+MAX_LATIN1_RATIO = 0.1
+MAX_INVISIBLE_RATIO = 0.5
+MAX_SINGLE_LETTER_RATIO = 0.08
+MIN_FUNCTION_WORD_RATIO = 0.1
+MIN_WORDS_FOR_LEXICAL_CHECK = 20
+
+# Very frequent Arabic words; real prose is roughly a quarter function words
+FUNCTION_WORDS = frozenset(
+    'في من على إلى الى أن ان إن عن مع هذا هذه التي الذي التى الذى ما لا كان كل '
+    'بين أو او ثم قد هو هي وهو وهي بعد عند حيث حتى ذلك تلك لم لن إذا اذا كما أي '
+    'غير فيها منها عليه'.split()
+)
+
+ARABIC_RE = re.compile(r'[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF\uFB50-\uFDFF\uFE70-\uFEFF]')
+# Unmapped glyphs, private-use code points and control characters
+BROKEN_RE = re.compile(r'[\uFFFD\uE000-\uF8FF\x00-\x08\x0B\x0C\x0E-\x1F\x7F-\x9F]')
+# Arabic code-page text decoded as Latin-1 turns into accented Latin letters
+LATIN1_RE = re.compile(r'[\xC0-\xFF]')
+LETTER_RE = re.compile(r'[^\W\d_]')
+ARABIC_WORD_RE = re.compile(r'^[\u0600-\u06FF]+$')
+
+def classify_text(text):
+    """
+    Decide whether extracted text looks trustworthy.
+    Returns (usable, reason).
+    """
+    chars = len(''.join(text.split()))
+    if chars < MIN_TEXT_CHARS:
+        return False, "too little text"
+
+    if len(BROKEN_RE.findall(text)) / chars > MAX_BROKEN_RATIO:
+        return False, "unmapped or private-use glyphs"
+
+    letters = len(LETTER_RE.findall(text))
+    if letters == 0:
+        return False, "no letters"
+    if len(LATIN1_RE.findall(text)) / letters > MAX_LATIN1_RATIO:
+        return False, "mojibake"
+    if len(ARABIC_RE.findall(text)) / letters < MIN_ARABIC_RATIO:
+        return False, "little Arabic text"
+
+    words = [word for word in text.split() if ARABIC_WORD_RE.match(word)]
+    if len(words) >= MIN_WORDS_FOR_LEXICAL_CHECK:
+        single_letters = sum(1 for word in words if len(word) == 1 and word != 'و')
+        if single_letters / len(words) > MAX_SINGLE_LETTER_RATIO:
+            return False, "garbled glyph mapping"
+        function_words = sum(1 for word in words if word in FUNCTION_WORDS)
+        if function_words / len(words) < MIN_FUNCTION_WORD_RATIO:
+            return False, "garbled glyph mapping"
+
+    return True, "usable text layer"
+
+def invisible_text_ratio(page):
+    """Share of a page's characters drawn invisibly (render mode 3), as OCR layers are"""
+    visible = invisible = 0
+    for span in page.get_texttrace():
+        if span['type'] == 3:
+            invisible += len(span['chars'])
+        else:
+            visible += len(span['chars'])
+    return invisible / (visible + invisible) if invisible else 0.0
+
+def has_ocr_layer(page):
+    """True if most of a page's text is an invisible layer from an earlier OCR pass"""
+    return invisible_text_ratio(page) > MAX_INVISIBLE_RATIO
+
+def classify_page(page):
+    """Decide whether a PyMuPDF page's own text can replace OCR. Returns (usable, reason)."""
+    if has_ocr_layer(page):
+        return False, "existing OCR layer"
+
+    return classify_text(page.get_text('text'))
+
+def page_text_lines(page, dpi=200):
+    """
+    Pull a page's text lines with their positions, in the same form as
+    ocr_engine.extract_lines(): boxes are [xmin, ymin, xmax, ymax] in the
+    pixels of a render at `dpi`, and every score is 1.0.
+    Returns None if the page has no text.
+    """
+    to_raster = page.rotation_matrix * fitz.Matrix(dpi / 72, dpi / 72)
+    texts, boxes = [], []
+
+    for block in page.get_text('dict', sort=True)['blocks']:
+        for line in block.get('lines', []):
+            text = ''.join(span['text'] for span in line['spans']).strip()
+            if not text:
+                continue
+            # Fold Arabic presentation forms back to regular letters
+            texts.append(unicodedata.normalize('NFKC', text))
+            rect = fitz.Rect(line['bbox']) * to_raster
+            boxes.append([rect.x0, rect.y0, rect.x1, rect.y1])
+
+    if not texts:
+        return None
+    return {
+        'rec_texts': texts,
+        'rec_scores': [1.0] * len(texts),
+        'rec_boxes': np.round(boxes).astype(int),
+    }
+
+def find_text_pages(pdf_path):
+    """Return the 0-indexed pages of a PDF whose embedded text is usable"""
+    with fitz.open(pdf_path) as doc:
+        return [page.number for page in doc if classify_page(page)[0]]
+
+def extract_text_layers(pdf_path, dpi=200):
+    """Return {page_index: lines} for every page whose embedded text is usable"""
+    text_layers = {}
+    with fitz.open(pdf_path) as doc:
+        for page in doc:
+            if classify_page(page)[0]:
+                text_layers[page.number] = page_text_lines(page, dpi)
+    return text_layers
+
+def page_markdown(page):
+    """Render a page's text layer as plain markdown: one paragraph per text block"""
+    paragraphs = []
+    for block in page.get_text('dict', sort=True)['blocks']:
+        lines = [''.join(span['text'] for span in line['spans']).strip()
+                 for line in block.get('lines', [])]
+        lines = [line for line in lines if line]
+        if lines:
+            paragraphs.append(unicodedata.normalize('NFKC', '\n'.join(lines)))
+    return '\n\n'.join(paragraphs)
@@ -0,0 +1,300 @@
+"""
+Output writers for the local OCR pipeline.
+Each writer consumes finished PageResults in page order. WriterPool runs every
+selected writer on its own thread, fed through a bounded queue, so a slow
+writer does not hold up OCR or the other writers.
+"""
+import io
+import os
+import queue
+import threading
+import fitz  # PyMuPDF
+from docx import Document
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from shaping import visual_lines
+
+FONT_PATH = '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+
+HTML_HEADER = '''<html dir="rtl">
+<head>
+    <meta charset="utf-8">
+    <link rel="preconnect" href="https://fonts.googleapis.com">
+    <link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
+    <link href="https://fonts.googleapis.com/css2?family=Cairo:wght@400;700&family=Roboto+Mono:wght@400;700&display=swap" rel="stylesheet">
+    <style>
+        body {
+            font-family: 'Cairo', 'Roboto Mono', monospace;
+            line-height: 1.8;
+            background-color: #f9f9f9;
+            color: #333;
+            max-width: 900px;
+            margin: 0 auto;
+            padding: 40px;
+        }
+        .page {
+            background: white;
+            padding: 40px;
+            margin-bottom: 20px;
+            box-shadow: 0 2px 5px rgba(0,0,0,0.1);
+            border-radius: 8px;
+        }
+        p { margin-bottom: 12px; }
+        .rtl { direction: rtl; text-align: right; }
+        .ltr {
+            direction: ltr;
+            text-align: left;
+            font-family: 'Roboto Mono', monospace;
+            background-color: #f5f5f5;
+            padding: 8px;
+            border-radius: 4px;
+            border-left: 3px solid #4CAF50;
+        }
+        hr { border: 0; border-top: 1px solid #eee; margin: 40px 0; }
+    </style>
+</head>
+<body>'''
+
+class PageWriter:
+    """
+    Base class for output writers.
+    Subclasses set `label` and `suffix` and implement write_page() and save().
+    Set `needs_image` if write_page() needs the rendered page image, and
+    clear `threaded` if the writer must run on the caller's thread.
+    """
+    label = None
+    suffix = None
+    needs_image = False
+    threaded = True
+
+    def __init__(self, pdf_path, output_dir, base_name, page_count, dpi=200):
+        self.pdf_path = pdf_path
+        self.output_path = os.path.join(output_dir, f"{base_name}{self.suffix}")
+        self.page_count = page_count
+        self.dpi = dpi
+
+    def write_page(self, page_index, result, image):
+        """
+        Add one page. `result` is a PageResult, or None if nothing was
+        recognized; `image` is the rendered PIL page if needs_image is set.
+        """
+        raise NotImplementedError
+
+    def save(self):
+        """Finish the output file"""
+        raise NotImplementedError
+
+class DocxWriter(PageWriter):
+    label = "Word doc"
+    suffix = ".docx"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.doc = Document()
+
+    def write_page(self, page_index, result, image):
+        if result is None:
+            return
+        for text, is_arabic in zip(result.texts, result.is_rtl):
+            p = self.doc.add_paragraph(text)
+            p.alignment = WD_ALIGN_PARAGRAPH.RIGHT if is_arabic else WD_ALIGN_PARAGRAPH.LEFT
+
+        # Add page break in Word
+        if page_index < self.page_count - 1:
+            self.doc.add_page_break()
+
+    def save(self):
+        self.doc.save(self.output_path)
+
+class HtmlWriter(PageWriter):
+    label = "HTML"
+    suffix = ".html"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.html_content = []
+
+    def write_page(self, page_index, result, image):
+        if result is None:
+            return
+        self.html_content.append(f'<div class="page" id="page-{page_index+1}">')
+        for text, is_arabic in zip(result.texts, result.is_rtl):
+            direction = 'rtl' if is_arabic else 'ltr'
+            self.html_content.append(f'<p class="{direction}">{text}</p>')
+        self.html_content.append('</div><hr>')
+
+    def save(self):
+        final_html = HTML_HEADER + "".join(self.html_content) + '</body></html>'
+        with open(self.output_path, 'w', encoding='utf-8') as f:
+            f.write(final_html)
+
+class RasterPdfWriter(PageWriter):
+    """Searchable PDF rebuilt from the rendered page images plus invisible text"""
+    label = "Searchable PDF"
+    suffix = "_searchable.pdf"
+    needs_image = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.canvas = canvas.Canvas(self.output_path, pagesize=A4)
+        # Register Arabic font for PDF
+        if os.path.exists(FONT_PATH):
+            pdfmetrics.registerFont(TTFont('DejaVuSans', FONT_PATH))
+        else:
+            print("Warning: DejaVuSans font not found. PDF text might not render correctly.")
+
+    def write_page(self, page_index, result, image):
+        c = self.canvas
+        # Draw Image FIRST (so text is on top)
+        # Encoded in memory; reportlab embeds the JPEG bytes as-is
+        jpeg_buffer = io.BytesIO()
+        image.save(jpeg_buffer, format='JPEG')
+        c.setPageSize((image.width, image.height))
+        c.drawImage(ImageReader(jpeg_buffer), 0, 0, width=image.width, height=image.height)
+
+        if result is not None:
+            # Handle Arabic reshaping
+            texts = visual_lines(result.texts)
+            for text, (x, y), font_size in zip(texts, result.flipped_origins, result.font_sizes):
+                t = c.beginText()
+                t.setTextRenderMode(3) # Invisible
+                t.setFont('DejaVuSans', font_size)
+                t.setTextOrigin(x, y)
+                t.textOut(text)
+                c.drawText(t)
+        c.showPage()
+
+    def save(self):
+        self.canvas.save()
+
+def text_layer_matrix(page, text_writer):
+    """
+    Matrix for TextWriter.write_text() that places text appended in displayed
+    page coordinates onto the page, rotating lines along with their origins
+    on /Rotate pages. write_text() shifts by cropbox_position, a y-down value,
+    as if it were PDF space; that shift is undone here, so cropped pages are
+    placed correctly too.
+    """
+    mediabox = page.mediabox
+    shift = page.cropbox_position
+    delta = page.rect.height - page.rect.width if page.rotation in (90, 270) else 0
+    applied = fitz.Matrix(1, 0, 0, 1, shift.x, shift.y + mediabox.y0 - delta)
+    # Unrotated, y-down page coordinates -> PDF user space
+    to_pdf = fitz.Matrix(1, 0, 0, -1, page.cropbox.x0, mediabox.y1 - page.cropbox.y0)
+    return text_writer.ictm * page.derotation_matrix * to_pdf * ~applied
+
+class OverlayPdfWriter(PageWriter):
+    """Searchable PDF made by adding an invisible text layer to the original pages"""
+    label = "Searchable PDF"
+    suffix = "_searchable.pdf"
+    # PyMuPDF is not thread-safe and pages are rendered with it meanwhile
+    threaded = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Reuse the original pages; only a text layer is added
+        self.doc = fitz.open(self.pdf_path)
+        if os.path.exists(FONT_PATH):
+            self.font = fitz.Font(fontfile=FONT_PATH)
+        else:
+            print("Warning: DejaVuSans font not found. PDF text might not render correctly.")
+            self.font = fitz.Font('helv')
+        # Raster pixels -> PDF points
+        self.px_to_pt = 72 / self.dpi
+
+    def write_page(self, page_index, result, image):
+        # Pages with their own text layer are already searchable
+        if result is None or result.from_text_layer or not len(result):
+            return
+        page = self.doc[page_index]
+        text_writer = fitz.TextWriter(page.rect)
+
+        # Baseline at each box's bottom-left corner, in points on the page as displayed
+        origins = result.origins * self.px_to_pt
+        for text, origin, font_size in zip(visual_lines(result.texts), origins, result.font_sizes):
+            text_writer.append(origin, text, font=self.font,
+                               fontsize=font_size * self.px_to_pt)
+        text_writer.write_text(page, render_mode=3, matrix=text_layer_matrix(page, text_writer)) # Invisible
+
+    def save(self):
+        # Embed only the glyphs used, not the whole font
+        self.doc.subset_fonts()
+        self.doc.save(self.output_path, garbage=3, deflate=True)
+        self.doc.close()
+
+# Output format -> writer class; 'pdf' picks its class from the PDF mode
+WRITERS = {
+    'docx': DocxWriter,
+    'html': HtmlWriter,
+    'pdf': RasterPdfWriter,
+    'pdf-overlay': OverlayPdfWriter,
+}
+OUTPUT_FORMATS = ['docx', 'html', 'pdf']
+
+class WriterPool:
+    """
+    Fan finished pages out to several writers, each threaded writer on its
+    own thread. Every thread has a bounded queue, so memory stays flat while
+    a slower writer catches up; submit() blocks once a queue is full.
+    Writers that are not `threaded` run inside submit() and close() on the
+    caller's thread, between pages.
+    """
+
+    def __init__(self, writers, queue_size=4):
+        self.writers = writers
+        self.needs_image = any(writer.needs_image for writer in writers)
+        self._inline = [writer for writer in writers if not writer.threaded]
+        threaded = [writer for writer in writers if writer.threaded]
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in threaded]
+        self._errors = {}
+        self._threads = [
+            threading.Thread(target=self._run, args=(writer, q), name=f"writer-{writer.suffix}", daemon=True)
+            for writer, q in zip(threaded, self._queues)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _write(self, writer, item):
+        # Skip pages after a failure so submit() never blocks forever
+        if writer in self._errors:
+            return
+        try:
+            writer.write_page(*item)
+        except Exception as e:
+            self._errors[writer] = e
+
+    def _save(self, writer):
+        if writer not in self._errors:
+            try:
+                writer.save()
+            except Exception as e:
+                self._errors[writer] = e
+
+    def _run(self, writer, q):
+        while True:
+            item = q.get()
+            if item is None:
+                break
+            self._write(writer, item)
+        self._save(writer)
+
+    def submit(self, page_index, result, image=None):
+        """Queue a page for every threaded writer and write it with the others"""
+        for q in self._queues:
+            q.put((page_index, result, image))
+        for writer in self._inline:
+            self._write(writer, (page_index, result, image))
+
+    def close(self):
+        """Wait for all writers to finish; returns {writer: error} for writers that failed"""
+        for q in self._queues:
+            q.put(None)
+        for writer in self._inline:
+            self._save(writer)
+        for thread in self._threads:
+            thread.join()
+        return dict(self._errors)